@@ -1,5 +1,8 @@
 import os
 
+import pytest
+from django.test import override_settings
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +40,14 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def media_root(tmp_path_factory):
+    # Миниатюры режутся в фоне после коммита: ждём их, чтобы файлы
+    # не попали в media рабочей копии после отмены настройки.
+    from posts import thumbnails
+
+    with override_settings(MEDIA_ROOT=str(tmp_path_factory.mktemp('media'))):
+        yield
+        thumbnails.shutdown()
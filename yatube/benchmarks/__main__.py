@@ -0,0 +1,137 @@
+"""Нагрузочный прогон страниц проекта.
+
+Запуск из каталога yatube:
+
+    python -m benchmarks --posts 10000 --output bench.json
+    python -m benchmarks --compare bench.json
+
+Данные создаются в отдельной тестовой базе, рабочая база не
+затрагивается.
+"""
+import argparse
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import django
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--groups', type=int, default=5)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=2000)
+    parser.add_argument('--follows', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='запросов на страницу в каждом режиме')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--no-load', action='store_true',
+                        help='только тестовый клиент, без WSGI-сервера')
+    parser.add_argument('--profile-templates', action='store_true',
+                        help='время рендера по шаблонам и {% include %} '
+                             '(замедляет все режимы)')
+    parser.add_argument('--batch', action='store_true',
+                        help='замерить и пакетные пересчёты')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для результатов в JSON')
+    parser.add_argument('--compare',
+                        help='JSON предыдущего прогона для сравнения')
+    return parser.parse_args(argv)
+
+
+def _print(results):
+    for view, modes in results['views'].items():
+        for mode, summary in modes.items():
+            print(
+                f'{view:14} {mode:7} p50 {summary["p50_ms"]:8.2f} ms  '
+                f'p95 {summary["p95_ms"]:8.2f} ms  '
+                f'{summary["bytes"]:7} B  '
+                f'{summary.get("queries", "-")} запр.'
+            )
+    for job, summary in results.get('batch', {}).items():
+        print(f'{job:22} {summary["ms"]:10.2f} ms  {summary["rows"]} строк')
+    for view, profile in results.get('templates', {}).items():
+        for item in profile[:5]:
+            print(
+                f'{view:20} {item["template"]:36} x{item["count"]:<6} '
+                f'self {item["self_ms"]:7.2f} ms  '
+                f'total {item["total_ms"]:7.2f} ms'
+            )
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from core.metrics import aggregates
+
+    from . import report, runner, seed
+
+    settings.DEBUG = False
+    if options.profile_templates:
+        settings.METRICS_TEMPLATE_PROFILE = True
+        settings.METRICS_SAMPLE_RATE = 1.0
+        aggregates.reset()
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    volumes = seed.seed(
+        users=options.users,
+        groups=options.groups,
+        posts=options.posts,
+        comments=options.comments,
+        follows=options.follows,
+        random_seed=options.seed,
+    )
+    results = {
+        'commit': _commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'volumes': volumes,
+        'views': runner.run(
+            requests=options.requests,
+            concurrency=options.concurrency,
+            load=not options.no_load,
+        ),
+    }
+    if options.batch:
+        results['batch'] = runner.run_batch()
+    if options.profile_templates:
+        results['templates'] = {
+            view: summary.get('templates', [])
+            for view, summary in aggregates.snapshot().items()
+        }
+    if options.output:
+        report.write(results, options.output)
+    _print(results)
+    if options.compare:
+        baseline = report.load(options.compare)
+        for view, mode, old, new, change in report.compare(
+            baseline, results
+        ):
+            print(f'{view:14} {mode:7} p95 {old:8.2f} -> {new:8.2f} ms '
+                  f'({change:+.1f}%)')
+    return results
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,51 @@
+import json
+import math
+import statistics
+
+
+def percentile(values, rank):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(math.ceil(rank / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def summarize(timings, **extra):
+    milliseconds = [timing * 1000 for timing in timings]
+    summary = {
+        'requests': len(milliseconds),
+        'mean_ms': round(statistics.mean(milliseconds), 3)
+        if milliseconds else 0.0,
+    }
+    for rank in (50, 90, 95, 99):
+        summary[f'p{rank}_ms'] = round(percentile(milliseconds, rank), 3)
+    summary['max_ms'] = round(max(milliseconds, default=0.0), 3)
+    summary.update(extra)
+    return summary
+
+
+def write(results, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(results, output, ensure_ascii=False, indent=2)
+        output.write('\n')
+
+
+def load(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def compare(baseline, current, metric='p95_ms'):
+    """Изменение метрики по каждой странице и режиму прогона
+    относительно предыдущего результата, в процентах."""
+    changes = []
+    for view, modes in current['views'].items():
+        for mode, summary in modes.items():
+            before = baseline['views'].get(view, {}).get(mode, {})
+            old, new = before.get(metric), summary.get(metric)
+            if not old or new is None:
+                continue
+            changes.append((view, mode, old, new, (new - old) / old * 100))
+    return changes
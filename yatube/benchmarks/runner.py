@@ -0,0 +1,280 @@
+import asyncio
+import http.client
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.asgi import WsgiToAsgi
+from posts import recommendations, related
+from posts.models import Follow, Group, Post, User
+
+from .report import summarize
+
+
+def targets():
+    """Страницы для замера на самых «тяжёлых» объектах базы."""
+    group = Group.objects.order_by('-posts_count').first()
+    author = User.objects.order_by('-profile__posts_count').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    reader = User.objects.order_by('-profile__following_count').first()
+    pages = {
+        'index': (reverse('posts:index'), None),
+        'trending': (reverse('posts:trending'), None),
+    }
+    if group is not None:
+        pages['group_list'] = (
+            reverse('posts:group_list', args=[group.slug]), None
+        )
+    if author is not None:
+        pages['profile'] = (
+            reverse('posts:profile', args=[author.username]), None
+        )
+    if post is not None:
+        pages['post_detail'] = (
+            reverse('posts:post_detail', args=[post.pk]), None
+        )
+    if reader is not None and Follow.objects.filter(user=reader).exists():
+        pages['follow_index'] = (reverse('posts:follow_index'), reader)
+    return pages
+
+
+def _client(user):
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def run_client(url, user, requests):
+    """Прогон через тестовый клиент: задержка, число запросов к базе
+    и размер ответа. Первый запрос идёт по пустому кэшу и
+    учитывается отдельно."""
+    client = _client(user)
+    cache.clear()
+    timings, queries, sizes = [], [], []
+    cold = None
+    for number in range(requests + 1):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f'{url}: ответ {response.status_code}')
+        if number == 0:
+            cold = {
+                'ms': round(elapsed * 1000, 3),
+                'queries': len(captured),
+            }
+            continue
+        timings.append(elapsed)
+        queries.append(len(captured))
+        sizes.append(len(response.content))
+    return summarize(
+        timings,
+        cold=cold,
+        queries=max(queries, default=0),
+        bytes=max(sizes, default=0),
+    )
+
+
+class _ThreadPoolServer(WSGIServer):
+    """Постоянный набор потоков, как у gunicorn с gthread: соединения
+    с базой переиспользуются между запросами."""
+
+    threads = 8
+
+    def server_activate(self):
+        super().server_activate()
+        self.pool = ThreadPoolExecutor(max_workers=self.threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LoadServer:
+    """WSGI-приложение проекта на случайном порту в фоновых потоках."""
+
+    def __init__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(),
+            server_class=_ThreadPoolServer, handler_class=_QuietHandler
+        )
+        self.port = self.server.server_port
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _session_cookie(user):
+    if user is None:
+        return {}
+    client = _client(user)
+    return {'Cookie': f'sessionid={client.cookies["sessionid"].value}'}
+
+
+def _fetch(port, url, headers):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        started = time.perf_counter()
+        conn.request('GET', url, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    return response.status, elapsed, len(body)
+
+
+def run_load(server, url, user, requests, concurrency):
+    """Параллельная нагрузка на живой WSGI-сервер."""
+    headers = _session_cookie(user)
+    headers['Host'] = 'localhost'
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda _: _fetch(server.port, url, headers), range(requests)
+        ))
+    duration = time.perf_counter() - started
+    errors = sum(1 for status, _, _ in results if status != 200)
+    return summarize(
+        [elapsed for _, elapsed, _ in results],
+        concurrency=concurrency,
+        errors=errors,
+        rps=round(len(results) / duration, 1) if duration else 0.0,
+        bytes=max((size for _, _, size in results), default=0),
+    )
+
+
+def _asgi_fetch(application, url, headers):
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': query.encode(),
+        'headers': headers,
+        'server': ('localhost', 80),
+    }
+    response = {'status': None, 'size': 0}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['size'] += len(message.get('body', b''))
+
+    async def fetch():
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        elapsed = time.perf_counter() - started
+        return response['status'], elapsed, response['size']
+    return fetch()
+
+
+def run_asgi(url, user, requests, concurrency):
+    """Та же нагрузка через ASGI-приложение в цикле событий.
+
+    Сетевой слой не участвует: сравнение с run_load показывает
+    накладные расходы пула потоков ASGI-обёртки, а не сервера.
+    """
+    application = WsgiToAsgi(get_wsgi_application(), max_workers=concurrency)
+    headers = [(b'host', b'localhost')] + [
+        (name.lower().encode(), value.encode())
+        for name, value in _session_cookie(user).items()
+    ]
+
+    async def load():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await _asgi_fetch(application, url, headers)
+        return await asyncio.gather(*[limited() for _ in range(requests)])
+
+    started = time.perf_counter()
+    try:
+        results = asyncio.run(load())
+    finally:
+        application.executor.shutdown()
+    duration = time.perf_counter() - started
+    errors = sum(1 for status, _, _ in results if status != 200)
+    return summarize(
+        [elapsed for _, elapsed, _ in results],
+        concurrency=concurrency,
+        errors=errors,
+        rps=round(len(results) / duration, 1) if duration else 0.0,
+        bytes=max((size for _, _, size in results), default=0),
+    )
+
+
+def run(requests=50, concurrency=4, load=True):
+    pages = targets()
+    results = {}
+    for name, (url, user) in pages.items():
+        results[name] = {'client': run_client(url, user, requests)}
+    if load:
+        with LoadServer() as server:
+            for name, (url, user) in pages.items():
+                results[name]['wsgi'] = run_load(
+                    server, url, user, requests, concurrency
+                )
+        for name, (url, user) in pages.items():
+            results[name]['asgi'] = run_asgi(url, user, requests, concurrency)
+    return results
+
+
+def run_batch():
+    """Время пакетных пересчётов на наполненной базе. Матрица похожих
+    записей пишется во временный каталог, а не в рабочую копию."""
+    jobs = {
+        'recommendations': recommendations.rebuild,
+        'related': lambda: related.rebuild()[0],
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        with override_settings(RELATED_ROOT=root):
+            for name, job in jobs.items():
+                started = time.perf_counter()
+                rows = job()
+                results[name] = {
+                    'ms': round((time.perf_counter() - started) * 1000, 3),
+                    'rows': rows,
+                }
+    return results
@@ -0,0 +1,90 @@
+import random
+from itertools import islice
+
+from faker import Faker
+from mixer.backend.django import mixer
+
+from posts import (counters, fanout, recommendations, rendering, search,
+                   trending)
+from posts.models import Comment, Follow, Group, Post, User
+
+
+BATCH_SIZE = 500
+
+
+def _batches(objects, model, batch_size=BATCH_SIZE):
+    # Объекты создаются лениво и сохраняются по batch_size: в памяти
+    # не бывает больше одного пакета. Внутри пакета размер запроса
+    # дальше дробит бэкенд (у SQLite ограничено число термов).
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+def seed(users=50, groups=5, posts=1000, comments=2000, follows=200,
+         random_seed=0):
+    """Заполняет базу данными заданного объёма.
+
+    Пользователи и группы создаются через mixer, записи, комментарии
+    и подписки — пакетами bulk_create с текстом от Faker. После этого
+    пересчитываются счётчики, поисковый индекс, ленты подписок
+    и популярное, которые при bulk_create не обновляются сигналами.
+    """
+    fake = Faker('ru_RU')
+    fake.seed_instance(random_seed)
+    rnd = random.Random(random_seed)
+    authors = mixer.cycle(users).blend(
+        User, username=mixer.sequence('bench_user_{0}')
+    )
+    group_list = mixer.cycle(groups).blend(
+        Group, slug=mixer.sequence('bench-group-{0}')
+    )
+    _batches(
+        (
+            Post(
+                author=rnd.choice(authors),
+                group=rnd.choice(group_list + [None]),
+                text=fake.text(max_nb_chars=400),
+            )
+            for _ in range(posts)
+        ),
+        Post
+    )
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    _batches(
+        (
+            Comment(
+                post_id=rnd.choice(post_ids),
+                author=rnd.choice(authors),
+                text=fake.sentence(),
+            )
+            for _ in range(comments)
+        ),
+        Comment
+    )
+    pairs = set()
+    while len(pairs) < min(follows, users * (users - 1)):
+        user, author = rnd.sample(authors, 2)
+        pairs.add((user.pk, author.pk))
+    _batches(
+        (Follow(user_id=user, author_id=author) for user, author in pairs),
+        Follow
+    )
+    counters.create_missing_profiles()
+    counters.rebuild()
+    search.rebuild()
+    rendering.rerender((Post, Comment))
+    for user_id, author_id in pairs:
+        fanout.backfill([user_id], author_id)
+    recommendations.rebuild()
+    trending.rebuild()
+    return {
+        'users': users,
+        'groups': groups,
+        'posts': posts,
+        'comments': comments,
+        'follows': len(pairs),
+    }
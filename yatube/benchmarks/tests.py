@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from posts.models import Comment, Follow, FeedEntry, Post
+
+from . import report, runner, seed
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_volumes(self):
+        """Наполнение создаёт заданный объём данных и ленты подписок."""
+        volumes = seed.seed(
+            users=5, groups=2, posts=30, comments=20, follows=6
+        )
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), volumes['follows'])
+        self.assertTrue(FeedEntry.objects.exists())
+
+    def test_client_run(self):
+        """Прогон через клиент возвращает перцентили, запросы и размер."""
+        seed.seed(users=5, groups=2, posts=30, comments=20, follows=6)
+        results = runner.run(requests=3, load=False)
+        self.assertIn('follow_index', results)
+        for modes in results.values():
+            summary = modes['client']
+            self.assertEqual(summary['requests'], 3)
+            self.assertGreater(summary['queries'], 0)
+            self.assertGreater(summary['bytes'], 0)
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+    def test_batch_run(self):
+        """Пакетные пересчёты замеряются по времени и числу строк."""
+        seed.seed(users=5, groups=2, posts=30, comments=20, follows=6)
+        results = runner.run_batch()
+        self.assertEqual(results['recommendations']['rows'], 5)
+        self.assertEqual(results['related']['rows'], 30)
+        self.assertGreaterEqual(results['recommendations']['ms'], 0)
+
+    def test_percentile(self):
+        """Перцентиль считается по ближайшему рангу."""
+        values = list(range(1, 101))
+        self.assertEqual(report.percentile(values, 50), 50)
+        self.assertEqual(report.percentile(values, 99), 99)
+        self.assertEqual(report.percentile([], 95), 0.0)
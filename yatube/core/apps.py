@@ -3,3 +3,16 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_finished, request_started
+
+        from .db.pool import check_connections, release_idle_connections
+        from .metrics import instrument_templates
+        from .warmup import warm_templates
+        instrument_templates()
+        request_started.connect(check_connections)
+        request_finished.connect(release_idle_connections)
+        if settings.TEMPLATE_WARMUP:
+            warm_templates()
@@ -0,0 +1,347 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+
+class InMemoryRedis:
+    """Подмножество команд Redis в памяти процесса.
+
+    Используется в тестах и при локальном запуске вместо сервера:
+    поведение команд совпадает с redis-py настолько, насколько это
+    нужно RedisCache. Как и LocMemCache, держит не больше
+    max_entries ключей: при переполнении сначала удаляются истёкшие,
+    затем 1/cull_frequency давно не читанных (0 — все).
+    """
+
+    def __init__(self, max_entries=300, cull_frequency=3):
+        self.max_entries = max_entries
+        self.cull_frequency = cull_frequency
+        self._data = OrderedDict()
+        self._expires = {}
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+
+    def _alive(self, name):
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return name in self._data
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for name in [
+            name for name, expires in self._expires.items()
+            if expires <= now
+        ]:
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+
+    def _cull(self):
+        self._purge_expired()
+        if len(self._data) < self.max_entries:
+            return
+        if self.cull_frequency == 0:
+            self._data.clear()
+            self._expires.clear()
+            return
+        for _ in range(max(len(self._data) // self.cull_frequency, 1)):
+            name, _ = self._data.popitem(last=False)
+            self._expires.pop(name, None)
+
+    def _store(self, name, value):
+        if name not in self._data and len(self._data) >= self.max_entries:
+            self._cull()
+        self._data[name] = value
+        self._data.move_to_end(name)
+
+    def get(self, name):
+        with self._lock:
+            if not self._alive(name):
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._data.move_to_end(name)
+            return self._data[name]
+
+    def mget(self, names):
+        with self._lock:
+            return [self.get(name) for name in names]
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._alive(name):
+                return None
+            if not isinstance(value, bytes):
+                value = str(value).encode()
+            self._store(name, value)
+            self._expires.pop(name, None)
+            if ex is not None:
+                self._expires[name] = time.monotonic() + ex
+            return True
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if not self._alive(name):
+                return False
+            self._expires[name] = time.monotonic() + seconds
+            return True
+
+    def persist(self, name):
+        with self._lock:
+            return self._expires.pop(name, None) is not None
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._alive(name))
+
+    def delete(self, *names):
+        with self._lock:
+            deleted = 0
+            for name in names:
+                if self._alive(name):
+                    deleted += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return deleted
+
+    def incrby(self, name, amount=1):
+        with self._lock:
+            value = int(self._data[name] if self._alive(name) else 0)
+            value += amount
+            self._store(name, str(value).encode())
+            return value
+
+    def info(self, section=None):
+        with self._lock:
+            return {
+                'keyspace_hits': self._hits,
+                'keyspace_misses': self._misses,
+                'db0': {'keys': len(self._data)},
+            }
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            return True
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+    def close(self):
+        pass
+
+
+class _Pipeline:
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            results = [method(*args, **kwargs)
+                       for method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._commands = []
+
+
+_memory_servers = {}
+_memory_servers_lock = threading.Lock()
+
+
+def memory_server(name, max_entries=300, cull_frequency=3):
+    with _memory_servers_lock:
+        if name not in _memory_servers:
+            _memory_servers[name] = InMemoryRedis(
+                max_entries, cull_frequency
+            )
+        return _memory_servers[name]
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+class RedisCache(BaseCache):
+    """Кэш Django поверх протокола Redis.
+
+    LOCATION вида redis://host:port/db подключается к серверу через
+    redis-py, memory://<имя> — к общему для процесса InMemoryRedis
+    с ограничением OPTIONS MAX_ENTRIES и CULL_FREQUENCY (у сервера
+    Redis размер задаёт его maxmemory).
+    Целые числа хранятся как есть, чтобы incr() выполнялся атомарно
+    на сервере, остальные значения сериализуются pickle.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        self._location = server
+        self._client = None
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            url = urlparse(self._location)
+            if url.scheme == 'memory':
+                self._client = memory_server(
+                    url.netloc or 'default',
+                    self._max_entries,
+                    self._cull_frequency,
+                )
+            else:
+                try:
+                    import redis
+                except ImportError:
+                    raise ImproperlyConfigured(
+                        f'Для кэша {self._location} нужен пакет redis.'
+                    )
+                self._client = redis.Redis.from_url(self._location)
+        return self._client
+
+    def _timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(int(timeout), 0)
+
+    def _encode(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def _count(self, hits, misses):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+        metrics.record_cache(hits, misses)
+
+    def stats(self):
+        """Попадания этого процесса и сервера в целом."""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        info = self.client.info('stats')
+        server_hits = info.get('keyspace_hits', 0)
+        server_misses = info.get('keyspace_misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': _ratio(hits, misses),
+            'server_hits': server_hits,
+            'server_misses': server_misses,
+            'server_hit_ratio': _ratio(server_hits, server_misses),
+        }
+
+    def _write(self, client, key, value, timeout, nx=False):
+        timeout = self._timeout(timeout)
+        if timeout == 0:
+            return client.delete(key)
+        return client.set(key, self._encode(value), ex=timeout, nx=nx)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self._write(self.client, key, value, timeout, nx=True))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self.client.get(key)
+        if value is None:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return self._decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(self.client, key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        timeout = self._timeout(timeout)
+        if timeout is None:
+            self.client.persist(key)
+            return bool(self.client.exists(key))
+        return bool(self.client.expire(key, timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.client.delete(key)
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        values = self.client.mget(list(made))
+        found = {
+            made[key]: self._decode(value)
+            for key, value in zip(made, values)
+            if value is not None
+        }
+        self._count(len(found), len(made) - len(found))
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.client.pipeline() as pipe:
+            for key, value in data.items():
+                key = self.make_key(key, version=version)
+                self.validate_key(key)
+                self._write(pipe, key, value, timeout)
+            pipe.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self.client.exists(key))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if not self.client.exists(key):
+            raise ValueError(f"Key '{key}' not found")
+        return self.client.incrby(key, delta)
+
+    def clear(self):
+        self.client.flushdb()
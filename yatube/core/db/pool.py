@@ -0,0 +1,206 @@
+import threading
+import time
+import weakref
+
+from django.db import connections
+
+from .. import metrics
+
+
+class ConnectionPool:
+    """Ограничение числа соединений одного воркера с базой.
+
+    Соединения живут в потоках, как обычно в Django, и переиспользуются
+    между запросами до CONN_MAX_AGE; пул лишь не даёт потокам
+    (gthread) открыть их больше MAX_SIZE одновременно. Поток, которому
+    не хватило места, ждёт освобождения до TIMEOUT секунд.
+    """
+
+    def __init__(self, alias, max_size, timeout):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.opened = 0
+        self.closed = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        self.health_check_failures = 0
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            self._count(in_use=1, opened=1)
+            return True
+        self._count(waiting=1)
+        started = time.perf_counter()
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            self._count(waiting=-1)
+        waited = time.perf_counter() - started
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            request_metrics.pool_wait += waited
+        if acquired:
+            self._count(in_use=1, opened=1, waits=1, wait_time=waited)
+        else:
+            self._count(waits=1, wait_time=waited, timeouts=1)
+        return acquired
+
+    def release(self):
+        self._count(in_use=-1, closed=1)
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'opened': self.opened,
+                'closed': self.closed,
+                'waits': self.waits,
+                'wait_ms': round(self.wait_time * 1000, 2),
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'health_check_failures': self.health_check_failures,
+            }
+
+
+class Slot:
+    """Место, занятое одним соединением. Освобождается ровно один
+    раз: при закрытии соединения или при завершении потока-владельца,
+    смотря что случится раньше."""
+
+    def __init__(self, pool, owner):
+        self.pool = pool
+        self.owner = owner
+        self.held = True
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if not self.held:
+                return
+            self.held = False
+        self.owner.discard(self)
+        self.pool.release()
+
+
+def _release_all(slots):
+    while slots:
+        slots.pop().release()
+
+
+class _ThreadSlots:
+    def __init__(self):
+        self.slots = set()
+        weakref.finalize(self, _release_all, self.slots)
+
+
+_threads = threading.local()
+
+
+def bind_to_thread(pool):
+    """Место в пуле, которое вернётся, как только завершится текущий
+    поток. runserver заводит поток на запрос, и соединение с
+    CONN_MAX_AGE уходит вместе с ним незакрытым, а его обёртку
+    освободила бы только сборка циклов. Локальные данные потока
+    удаляются сразу при его завершении, и с ними срабатывает
+    финализатор."""
+    if not hasattr(_threads, 'owner'):
+        _threads.owner = _ThreadSlots()
+    slots = _threads.owner.slots
+    slot = Slot(pool, slots)
+    slots.add(slot)
+    return slot
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_for(alias, settings_dict):
+    with _pools_lock:
+        if alias not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[alias] = ConnectionPool(
+                alias,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+            )
+        return _pools[alias]
+
+
+def stats():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in sorted(pools.items())}
+
+
+class PooledConnectionMixin:
+    """Примесь к DatabaseWrapper бэкенда: каждое открытое соединение
+    занимает место в пуле своего алиаса до закрытия."""
+
+    @property
+    def pool(self):
+        return pool_for(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if not pool.acquire():
+            raise self.Database.OperationalError(
+                f'Нет свободных соединений с базой {self.alias} '
+                f'за {pool.timeout} с.'
+            )
+        try:
+            connection = super().get_new_connection(conn_params)
+        except Exception:
+            pool.release()
+            pool._count(errors=1)
+            raise
+        self._pool_slot = bind_to_thread(pool)
+        return connection
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._pool_slot.release()
+
+
+def check_connections(**kwargs):
+    """Проверка перед переиспользованием: соединение, которое база
+    успела закрыть, отбрасывается до того, как запрос на нём упадёт."""
+    for connection in connections.all():
+        if not connection.settings_dict.get('CONN_HEALTH_CHECKS', True):
+            continue
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            if isinstance(connection, PooledConnectionMixin):
+                connection.pool._count(health_check_failures=1)
+            connection.close()
+
+
+def release_idle_connections(**kwargs):
+    """После запроса отдаёт соединения потока ждущим: пока кто-то ждёт
+    места, простаивающее до CONN_MAX_AGE соединение закрывается сразу,
+    а не держит место до следующего запроса этого потока."""
+    for connection in connections.all():
+        if not isinstance(connection, PooledConnectionMixin):
+            continue
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if connection.pool.waiting:
+            connection.close()
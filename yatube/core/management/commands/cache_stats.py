@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэшей из settings.CACHES.'
+
+    def handle(self, *args, **options):
+        for alias in settings.CACHES:
+            backend = caches[alias]
+            if not hasattr(backend, 'stats'):
+                self.stdout.write(f'{alias}: статистика недоступна')
+                continue
+            stats = backend.stats()
+            self.stdout.write(
+                f"{alias}: попаданий {stats['server_hits']}, "
+                f"промахов {stats['server_misses']}, "
+                f"доля попаданий {stats['server_hit_ratio']:.1%}"
+            )
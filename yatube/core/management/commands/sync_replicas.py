@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную SQLite-базу в файлы реплик. Нужна только '
+            'при локальном запуске, где реплики — это копии файла, а не '
+            'настоящая репликация.')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('Реплики не настроены: DATABASE_REPLICAS.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in settings.REPLICA_DATABASES:
+            replica = connections[alias]
+            if {primary.vendor, replica.vendor} != {'sqlite'}:
+                raise CommandError(
+                    f'{alias}: копировать можно только SQLite в SQLite.'
+                )
+            primary.ensure_connection()
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            self.stdout.write(self.style.SUCCESS(
+                f'{alias}: скопировано из {DEFAULT_DB_ALIAS}'
+            ))
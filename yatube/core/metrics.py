@@ -0,0 +1,244 @@
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.template.base import Template
+
+_local = threading.local()
+
+
+def current():
+    """Метрики запроса, который обрабатывается в этом потоке."""
+    return getattr(_local, 'metrics', None)
+
+
+class RequestMetrics:
+    """Счётчики одного запроса: SQL, шаблоны и кэш.
+
+    С profile_templates время рендера копится ещё и по каждому
+    шаблону: сам шаблон и каждый {% include %} отдельно, целиком
+    и без вложенных. Родитель из {% extends %} отдельно не виден:
+    его время входит в шаблон страницы.
+    """
+
+    PROFILE_TOP = 5
+
+    def __init__(self, profile_templates=False):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+        self.template_time = 0.0
+        # Время вложенных шаблонов для каждого рендерящегося сейчас.
+        self.template_stack = []
+        # Имя шаблона -> [рендеров, всего секунд, без вложенных].
+        self.templates = {} if profile_templates else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.pool_wait = 0.0
+
+    def __enter__(self):
+        self._previous = current()
+        _local.metrics = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.metrics = self._previous
+        self.total = time.perf_counter() - self.started
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка для connection.execute_wrapper().
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def template_rendered(self, name, elapsed, nested):
+        if self.template_stack:
+            self.template_stack[-1] += elapsed
+        else:
+            self.template_time += elapsed
+        if self.templates is not None:
+            stats = self.templates.setdefault(
+                name or '<string>', [0, 0.0, 0.0]
+            )
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += elapsed - nested
+
+    def template_profile(self):
+        return template_profile(self.templates or {})
+
+    @property
+    def duplicates(self):
+        """Сколько запросов повторяют уже выполненный SQL с другими
+        (или теми же) параметрами — типичный след N+1."""
+        return sum(count - 1 for count in self.statements.values())
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'queries': self.queries,
+            'duplicates': self.duplicates,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'pool_wait_ms': round(self.pool_wait * 1000, 2),
+        }
+
+    def server_timing(self):
+        profile = [
+            f'tpl-{number};dur={item["self_ms"]:.1f};'
+            f'desc="{item["template"]} x{item["count"]}"'
+            for number, item in enumerate(
+                self.template_profile()[:self.PROFILE_TOP], 1
+            )
+        ]
+        return ', '.join(profile + [
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{self.queries} queries, {self.duplicates} duplicate"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'pool;dur={self.pool_wait * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+
+def record_cache(hits, misses):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def template_profile(templates, requests=1):
+    """Профиль шаблонов в среднем на запрос, по убыванию
+    собственного времени."""
+    profile = [
+        {
+            'template': name,
+            'count': round(count / requests, 2),
+            'total_ms': round(total * 1000 / requests, 2),
+            'self_ms': round(own * 1000 / requests, 2),
+        }
+        for name, (count, total, own) in templates.items()
+    ]
+    return sorted(profile, key=lambda item: -item['self_ms'])
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        metrics = current()
+        if metrics is None or (
+            metrics.templates is None and metrics.template_stack
+        ):
+            # Без профиля вложенные шаблоны ({% include %}) уже
+            # учтены во времени внешнего.
+            return render(self, context)
+        metrics.template_stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = metrics.template_stack.pop()
+            metrics.template_rendered(self.name, elapsed, nested)
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument_templates():
+    if not getattr(Template.render, 'timed', False):
+        Template.render = _timed_render(Template.render)
+
+
+def _percentile(values, rank):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+class Aggregates:
+    """Сводка по выборке запросов для каждого представления.
+
+    Данные хранятся в памяти процесса: каждый воркер отдаёт свою
+    выборку. Для перцентилей держится окно последних запросов.
+    """
+
+    WINDOW = 1000
+    FIELDS = ('queries', 'duplicates', 'sql_ms', 'template_ms',
+              'cache_hits', 'cache_misses', 'pool_wait_ms')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def sampled(self):
+        return random.random() < settings.METRICS_SAMPLE_RATE
+
+    def observe(self, view, metrics):
+        values = metrics.as_dict()
+        with self._lock:
+            stats = self._views.setdefault(view, {
+                'count': 0,
+                'totals': Counter(),
+                'max_queries': 0,
+                'durations': deque(maxlen=self.WINDOW),
+                'templates': {},
+            })
+            stats['count'] += 1
+            for field in self.FIELDS:
+                stats['totals'][field] += values[field]
+            stats['max_queries'] = max(stats['max_queries'],
+                                       values['queries'])
+            stats['durations'].append(values['total_ms'])
+            for name, counts in (metrics.templates or {}).items():
+                totals = stats['templates'].setdefault(name, [0, 0.0, 0.0])
+                for index, value in enumerate(counts):
+                    totals[index] += value
+
+    def snapshot(self):
+        with self._lock:
+            views = {view: dict(stats) for view, stats in
+                     self._views.items()}
+            for stats in views.values():
+                stats['durations'] = list(stats['durations'])
+                stats['templates'] = {
+                    name: list(counts)
+                    for name, counts in stats['templates'].items()
+                }
+        result = {}
+        for view, stats in sorted(views.items()):
+            count = stats['count']
+            summary = {'count': count, 'max_queries': stats['max_queries']}
+            for field in self.FIELDS:
+                summary[f'avg_{field}'] = round(
+                    stats['totals'][field] / count, 2
+                )
+            for rank in (50, 95, 99):
+                summary[f'p{rank}_ms'] = _percentile(
+                    stats['durations'], rank
+                )
+            if stats['templates']:
+                summary['templates'] = template_profile(
+                    stats['templates'], count
+                )
+            result[view] = summary
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+aggregates = Aggregates()
@@ -0,0 +1,78 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers
+from .metrics import RequestMetrics, aggregates
+
+logger = logging.getLogger('core.metrics')
+
+
+class RequestMetricsMiddleware:
+    """Считает запросы к базе, время SQL и шаблонов и обращения к кэшу.
+
+    Итог отдаётся в заголовке Server-Timing и строкой лога, а выборка
+    запросов попадает в сводку, которую показывает core.views.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with ExitStack() as stack:
+            metrics = stack.enter_context(RequestMetrics(
+                profile_templates=settings.METRICS_TEMPLATE_PROFILE
+            ))
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        values = metrics.as_dict()
+        level = logging.INFO
+        if values['queries'] > settings.METRICS_QUERY_WARNING:
+            level = logging.WARNING
+        logger.log(
+            level,
+            '%s %s %s view=%s %s',
+            request.method, request.path, response.status_code, view,
+            ' '.join(f'{key}={value}' for key, value in values.items()),
+            extra={'view': view, 'status': response.status_code, **values},
+        )
+        if aggregates.sampled():
+            aggregates.observe(view, metrics)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Read-your-writes для PrimaryReplicaRouter.
+
+    Пока жива кука REPLICA_PIN_COOKIE, все чтения пользователя идут на
+    основную базу: реплика могла ещё не получить его последнюю запись.
+    Кука ставится на REPLICA_PIN_SECONDS после любого запроса, который
+    что-то записал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = settings.REPLICA_PIN_COOKIE in request.COOKIES
+        routers.use_replicas(
+            request.method in ('GET', 'HEAD', 'OPTIONS') and not pinned
+        )
+        try:
+            response = self.get_response(request)
+            if routers.wrote():
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE, '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+        finally:
+            routers.use_replicas(False)
+        return response
@@ -0,0 +1,51 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+_state = threading.local()
+
+
+def use_replicas(enabled):
+    """Разрешает читать с реплик в текущем потоке (на время запроса)."""
+    _state.replicas = enabled
+    _state.wrote = False
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    """Чтения представлений — на реплики, запись — на основную базу.
+
+    Реплики используются только там, где их разрешил
+    ReplicaRoutingMiddleware: в безопасных запросах пользователя, который
+    давно ничего не записывал. После первой записи в запросе и внутри
+    транзакций чтения тоже идут на основную базу, как и везде вне
+    запросов (команды, миграции, тесты).
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if (
+            not replicas
+            or not getattr(_state, 'replicas', False)
+            or wrote()
+            or connections[PRIMARY].in_atomic_block
+        ):
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.REPLICA_DATABASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
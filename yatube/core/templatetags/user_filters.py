@@ -7,3 +7,13 @@ register = template.Library()
 @register.filter
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.simple_tag(takes_context=True)
+def page_url(context, cursor=None):
+    query = context['request'].GET.copy()
+    query.pop('page', None)
+    query.pop('cursor', None)
+    if cursor:
+        query['cursor'] = cursor
+    return f'?{query.urlencode()}'
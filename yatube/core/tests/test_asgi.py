@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+from django.core.wsgi import get_wsgi_application
+from django.test import SimpleTestCase
+
+from ..asgi import WsgiToAsgi
+
+
+def call(application, scope, body=b''):
+    messages = [
+        {'type': 'http.request', 'body': body[:3], 'more_body': True},
+        {'type': 'http.request', 'body': body[3:], 'more_body': False},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return sent
+
+
+def http_scope(path, query=b'', method='GET', headers=()):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query,
+        'headers': [(b'host', b'localhost'), *headers],
+    }
+
+
+class WsgiToAsgiTests(SimpleTestCase):
+    def test_request_and_streamed_response(self):
+        """Запрос собирается в environ, ответ уходит по частям
+        из одного потока, после чего закрывается."""
+        seen = {}
+
+        class Response(list):
+            def close(self):
+                seen['closed'] = threading.get_ident()
+
+        def wsgi(environ, start_response):
+            seen['environ'] = environ
+            seen['body'] = environ['wsgi.input'].read()
+            seen['thread'] = threading.get_ident()
+            start_response('201 Created', [('X-Test', 'ok')])
+            return Response([b'one', b'', b'two'])
+
+        application = WsgiToAsgi(wsgi, max_workers=2)
+        sent = call(application, http_scope(
+            '/путь/', b'a=1', 'POST',
+            [(b'content-type', b'text/plain'), (b'x-forwarded-for', b'1'),
+             (b'x-forwarded-for', b'2')]
+        ), b'hello')
+        environ = seen['environ']
+        self.assertEqual(seen['body'], b'hello')
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(environ['QUERY_STRING'], 'a=1')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['HTTP_X_FORWARDED_FOR'], '1,2')
+        self.assertEqual(
+            environ['PATH_INFO'].encode('latin1').decode(), '/путь/'
+        )
+        self.assertEqual(sent[0], {
+            'type': 'http.response.start',
+            'status': 201,
+            'headers': [(b'x-test', b'ok')],
+        })
+        self.assertEqual(
+            [message['body'] for message in sent[1:]], [b'one', b'two', b'']
+        )
+        self.assertEqual(seen['closed'], seen['thread'])
+
+    def test_disconnect_before_body(self):
+        """Клиент ушёл, не дослав тело: приложение не вызывается."""
+        def wsgi(environ, start_response):
+            raise AssertionError('не должно вызываться')
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            raise AssertionError('нечего отправлять')
+
+        asyncio.run(WsgiToAsgi(wsgi)(http_scope('/'), receive, send))
+
+    def test_lifespan(self):
+        """Сервер получает подтверждения запуска и остановки."""
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(WsgiToAsgi(None)({'type': 'lifespan'}, receive, send))
+        self.assertEqual(
+            sent,
+            ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+        )
+
+    def test_django_page(self):
+        """Страница проекта отдаётся через ASGI-обёртку."""
+        application = WsgiToAsgi(get_wsgi_application())
+        sent = call(application, http_scope('/about/author/'))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'<html', b''.join(
+            message.get('body', b'') for message in sent[1:]
+        ).lower())
@@ -0,0 +1,78 @@
+from django.test import SimpleTestCase
+
+from ..cache import InMemoryRedis, RedisCache
+
+
+class RedisCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = RedisCache('memory://tests', {})
+        self.cache.clear()
+
+    def test_values_round_trip(self):
+        """Значения любых типов читаются в том же виде."""
+        values = {'int': 7, 'str': 'строка', 'list': [1, 'два'], 'dict': {}}
+        for key, value in values.items():
+            with self.subTest(key=key):
+                self.cache.set(key, value)
+                self.assertEqual(self.cache.get(key), value)
+
+    def test_add_and_incr(self):
+        """add не перезаписывает ключ, incr работает только с существующим."""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_many_and_delete(self):
+        """Пакетные операции читают и удаляют несколько ключей."""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.cache.delete_many(['a', 'b'])
+        self.assertFalse(self.cache.has_key('a'))
+
+    def test_zero_timeout_expires_immediately(self):
+        """Таймаут 0 сразу удаляет значение."""
+        self.cache.set('key', 'value', timeout=0)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_locations_share_memory_server(self):
+        """Бэкенды с одним LOCATION видят одни и те же данные."""
+        self.cache.set('shared', 'value')
+        other = RedisCache('memory://tests', {})
+        self.assertEqual(other.get('shared'), 'value')
+
+    def test_stats_count_hits_and_misses(self):
+        """Статистика считает попадания и промахи."""
+        self.cache.set('key', 'value')
+        self.cache.get('key')
+        self.cache.get('missing')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+
+class InMemoryRedisTests(SimpleTestCase):
+    def test_expired_keys_are_gone(self):
+        """Ключ с истёкшим сроком не находится."""
+        server = InMemoryRedis()
+        server.set('key', 'value', ex=0)
+        self.assertIsNone(server.get('key'))
+        self.assertEqual(server.exists('key'), 0)
+
+    def test_full_server_culls_least_recently_read(self):
+        """Переполненный сервер сначала удаляет истёкшие ключи,
+        затем давно не читанные."""
+        server = InMemoryRedis(max_entries=3, cull_frequency=3)
+        server.set('expired', 'value', ex=0)
+        server.set('old', 'value')
+        server.set('read', 'value')
+        server.set('new', 'value')
+        self.assertEqual(server.info()['db0']['keys'], 3)
+        server.get('old')
+        server.set('newest', 'value')
+        self.assertIsNone(server.get('read'))
+        for name in ('old', 'new', 'newest'):
+            with self.subTest(name=name):
+                self.assertIsNotNone(server.get(name))
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from ..metrics import RequestMetrics, aggregates
+from ..warmup import warm_templates
+
+User = get_user_model()
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        aggregates.reset()
+
+    def test_duplicate_queries(self):
+        """Повтор одного и того же SQL считается дубликатом."""
+        with RequestMetrics() as metrics:
+            with connection.execute_wrapper(metrics):
+                for pk in (1, 2, 2):
+                    list(User.objects.filter(pk=pk))
+        self.assertEqual(metrics.queries, 3)
+        self.assertEqual(metrics.duplicates, 2)
+        self.assertGreater(metrics.sql_time, 0)
+
+    def test_server_timing_header(self):
+        """Ответ несёт Server-Timing с базой, шаблонами и кэшем."""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for name in ('db;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            with self.subTest(name=name):
+                self.assertIn(name, timing)
+        self.assertNotIn('tpl;dur=0.0', timing)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        """Сводку видит только персонал, в ней есть выборка запросов."""
+        self.client.get(reverse('posts:index'))
+        url = reverse('metrics')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(
+            User.objects.create_user('admin', is_staff=True)
+        )
+        views = self.client.get(url).json()['views']
+        self.assertIn('posts:index', views)
+        index = views['posts:index']
+        self.assertEqual(index['count'], 1)
+        self.assertGreater(index['avg_queries'], 0)
+        self.assertGreater(index['avg_cache_misses'], 0)
+
+    @override_settings(METRICS_TEMPLATE_PROFILE=True)
+    def test_template_profile(self):
+        """Профиль показывает время каждого {% include %} и число
+        его рендеров на странице."""
+        cache.clear()
+        user = User.objects.create_user('auth')
+        Post.objects.bulk_create(
+            [Post(author=user, text=f'Запись {i}') for i in range(3)]
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn('tpl-1;dur=', response['Server-Timing'])
+        profile = {
+            item['template']: item
+            for item in aggregates.snapshot()['posts:index']['templates']
+        }
+        self.assertEqual(profile['includes/card.html']['count'], 3)
+        page = profile['posts/index.html']
+        self.assertEqual(page['count'], 1)
+        self.assertLess(page['self_ms'], page['total_ms'])
+
+
+class TemplateWarmupTests(SimpleTestCase):
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [settings.TEMPLATES_DIR],
+        'OPTIONS': {'loaders': [(
+            'django.template.loaders.cached.Loader',
+            settings.TEMPLATE_SOURCE_LOADERS,
+        )]},
+    }])
+    def test_warm_templates(self):
+        """Прогрев кладёт все шаблоны проекта в кэш загрузчика."""
+        self.assertGreater(warm_templates(), 0)
+        loader = engines['django'].engine.template_loaders[0]
+        for name in ('posts/index.html', 'includes/card.html'):
+            with self.subTest(name=name):
+                self.assertIn(name, loader.get_template_cache)
+
+    def test_without_cached_loader(self):
+        """Без кэширующего загрузчика прогревать нечего."""
+        self.assertEqual(warm_templates(), 0)
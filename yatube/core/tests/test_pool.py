@@ -0,0 +1,91 @@
+import gc
+import threading
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from ..db import pool
+from ..db.backends.sqlite3 import base
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_limit_and_timeout(self):
+        """Сверх MAX_SIZE соединение ждёт и по таймауту не выдаётся."""
+        connections = pool.ConnectionPool('test', max_size=1, timeout=0.01)
+        self.assertTrue(connections.acquire())
+        self.assertFalse(connections.acquire())
+        stats = connections.stats()
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['waits'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_waiter_gets_released_slot(self):
+        """Поток дожидается места, которое освободил другой поток."""
+        connections = pool.ConnectionPool('test', max_size=1, timeout=5)
+        connections.acquire()
+        threading.Timer(0.05, connections.release).start()
+        self.assertTrue(connections.acquire())
+        stats = connections.stats()
+        self.assertEqual((stats['opened'], stats['closed']), (2, 1))
+        self.assertGreater(stats['wait_ms'], 0)
+
+    def test_slot_is_released_when_thread_exits(self):
+        """Место потока, завершившегося с открытым соединением,
+        возвращается в пул без сборки мусора."""
+        connections = pool.ConnectionPool('test', max_size=1, timeout=1)
+
+        def work():
+            connections.acquire()
+            pool.bind_to_thread(connections)
+
+        gc.disable()
+        try:
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+            self.assertTrue(connections.acquire())
+        finally:
+            gc.enable()
+        self.assertEqual(connections.stats()['closed'], 1)
+
+    def test_slot_is_released_once(self):
+        """Закрытие соединения и завершение потока не освобождают
+        одно место дважды."""
+        connections = pool.ConnectionPool('test', max_size=2, timeout=0)
+        connections.acquire()
+        slot = pool.bind_to_thread(connections)
+        slot.release()
+        slot.release()
+        self.assertEqual(connections.stats()['in_use'], 0)
+        self.assertNotIn(slot, slot.owner)
+
+    def test_idle_connection_is_given_to_waiter(self):
+        """После запроса соединение закрывается, если места ждут."""
+        idle = mock.Mock(spec=base.DatabaseWrapper,
+                         connection=object(), in_atomic_block=False)
+        idle.pool.waiting = 1
+        with mock.patch.object(pool.connections, 'all',
+                               return_value=[idle]):
+            pool.release_idle_connections()
+        idle.close.assert_called_once()
+
+    def test_unusable_connection_is_closed(self):
+        """Проверка перед запросом закрывает мёртвое соединение."""
+        broken = mock.Mock(
+            settings_dict={}, connection=object(), in_atomic_block=False
+        )
+        broken.is_usable.return_value = False
+        with mock.patch.object(pool.connections, 'all',
+                               return_value=[broken]):
+            pool.check_connections()
+        broken.close.assert_called_once()
+
+
+class PooledBackendTests(TestCase):
+    def test_backend_counts_connection(self):
+        """Соединение default занимает место в пуле своего алиаса."""
+        connection.ensure_connection()
+        stats = pool.stats()['default']
+        self.assertGreaterEqual(stats['in_use'], 1)
+        self.assertEqual(stats['max_size'], 10)
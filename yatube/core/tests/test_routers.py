@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+
+from posts import rendering
+from posts.models import Post, User
+
+from .. import routers
+from ..middleware import ReplicaRoutingMiddleware
+
+router = routers.PrimaryReplicaRouter()
+
+# TestCase держит каждый тест в транзакции, а внутри неё роутер
+# намеренно читает из default, поэтому здесь TransactionTestCase.
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRouterTests(TransactionTestCase):
+    def tearDown(self):
+        routers.use_replicas(False)
+
+    def test_reads_outside_requests_use_primary(self):
+        """Вне запроса (команды, сигналы) чтения идут в default."""
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_reads_go_to_replica_until_write(self):
+        """В запросе чтения идут на реплику, после записи — в default."""
+        routers.use_replicas(True)
+        self.assertEqual(router.db_for_read(Post), 'replica1')
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_transaction_reads_primary(self):
+        """Внутри транзакции чтения идут в основную базу."""
+        routers.use_replicas(True)
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Post), 'default')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_no_replicas(self):
+        """Без настроенных реплик всё читается из default."""
+        routers.use_replicas(True)
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_PIN_SECONDS=7)
+class ReplicaRoutingMiddlewareTests(TransactionTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def route(self, request, write=False):
+        used = []
+
+        def view(request):
+            if write:
+                router.db_for_write(Post)
+            used.append(router.db_for_read(Post))
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return used[0], response
+
+    def test_safe_request_reads_replica(self):
+        """GET без записи читает с реплики и не ставит куку."""
+        database, response = self.route(self.factory.get('/'))
+        self.assertEqual(database, 'replica1')
+        self.assertNotIn('read_primary', response.cookies)
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_write_pins_primary(self):
+        """После записи ставится кука, с ней чтения идут в default."""
+        database, response = self.route(self.factory.post('/'), write=True)
+        self.assertEqual(database, 'default')
+        cookie = response.cookies['read_primary']
+        self.assertEqual(cookie['max-age'], 7)
+        request = self.factory.get('/')
+        request.COOKIES['read_primary'] = cookie.value
+        database, _ = self.route(request)
+        self.assertEqual(database, 'default')
+
+
+@override_settings(
+    REPLICA_DATABASES=['replica1'],
+    DATABASE_ROUTERS=['core.routers.PrimaryReplicaRouter'],
+)
+class ReplicaSetupTests(TransactionTestCase):
+    """Основная база и реплика — две настоящие базы SQLite. Реплика
+    не получает записей основной, как отставшая реплика."""
+
+    databases = {'default', 'replica1'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.databases['replica1'] = {
+            **settings.DATABASES['default'],
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+            'TEST': {'NAME': os.path.join(cls.directory, 'replica.sqlite3')},
+        }
+        super().setUpClass()
+        call_command('migrate', database='replica1', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections.databases['replica1']
+        del connections._connections.replica1
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        User.objects.using('replica1').bulk_create([self.user])
+        post = Post(author_id=self.user.pk, text='Только на реплике')
+        rendering.fill(post)
+        Post.objects.using('replica1').bulk_create([post])
+        self.client.force_login(self.user)
+        # Сессию реплика получила бы репликацией.
+        session = Session.objects.get()
+        Session.objects.using('replica1').bulk_create([session])
+
+    def index(self):
+        cache.clear()
+        return self.client.get(reverse('posts:index'))
+
+    def test_reads_replica_writes_primary_and_pins(self):
+        """Чтения идут с реплики, запись — в основную базу, а кука
+        после записи оставляет чтения на основной базе."""
+        self.assertContains(self.index(), 'Только на реплике')
+        text = 'Запись на основной базе'
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': text}
+        )
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertTrue(Post.objects.filter(text=text).exists())
+        self.assertFalse(
+            Post.objects.using('replica1').filter(text=text).exists()
+        )
+        response = self.index()
+        self.assertContains(response, text)
+        self.assertNotContains(response, 'Только на реплике')
+        del self.client.cookies[settings.REPLICA_PIN_COOKIE]
+        response = self.index()
+        self.assertContains(response, 'Только на реплике')
+        self.assertNotContains(response, text)
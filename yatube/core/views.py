@@ -1,5 +1,12 @@
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from .db import pool
+from .metrics import aggregates
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +22,16 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+@staff_member_required
+def metrics(request):
+    """Сводка метрик запросов этого процесса по представлениям
+    и состояние пулов соединений с базой."""
+    if request.method == 'POST':
+        aggregates.reset()
+    return JsonResponse({
+        'pid': os.getpid(),
+        'views': aggregates.snapshot(),
+        'pools': pool.stats(),
+    })
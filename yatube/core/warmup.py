@@ -0,0 +1,48 @@
+import logging
+import os
+
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.cached import Loader as CachedLoader
+from django.template.utils import get_app_template_dirs
+
+logger = logging.getLogger('core.templates')
+
+EXTENSIONS = ('.html', '.txt', '.xml')
+
+
+def template_names(engine):
+    """Имена всех шаблонов в DIRS и каталогах templates приложений."""
+    names = set()
+    for directory in [*engine.dirs, *get_app_template_dirs('templates')]:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(EXTENSIONS):
+                    path = os.path.relpath(
+                        os.path.join(root, filename), directory
+                    )
+                    names.add(path.replace(os.sep, '/'))
+    return sorted(names)
+
+
+def warm_templates():
+    """Компилирует все шаблоны в память cached.Loader, чтобы первые
+    запросы воркера не разбирали их с диска. Возвращает число
+    скомпилированных шаблонов; без кэширующего загрузчика ничего
+    не делает."""
+    compiled = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        engine = backend.engine
+        if not any(isinstance(loader, CachedLoader)
+                   for loader in engine.template_loaders):
+            continue
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError) as error:
+                logger.warning('Шаблон %s не скомпилирован: %s', name, error)
+            else:
+                compiled += 1
+    return compiled
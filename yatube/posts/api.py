@@ -0,0 +1,159 @@
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from . import fanout, versions
+from .conditional import Validators
+from .models import Group, Post, User
+from .paginator import KeysetPaginator
+from .views import POST_NUMBER
+
+PAGE_LIMIT = 100
+CHUNK_SIZE = 500
+KEYS = ('-pub_date', '-pk')
+FOLLOW_KEYS = ('-feed_pub_date', '-feed_post_id')
+# Поля записи в ответе и колонки, из которых они читаются через
+# values(): ни моделей, ни шаблонов API не создаёт.
+FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+    'views_count': 'views_count',
+}
+
+
+def _fields(request):
+    names = [
+        name.strip() for name in request.GET.get('fields', '').split(',')
+        if name.strip()
+    ]
+    unknown = set(names) - FIELDS.keys()
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return names or list(FIELDS)
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', POST_NUMBER))
+    except ValueError:
+        raise ValueError('limit должен быть числом')
+    return min(max(limit, 1), PAGE_LIMIT)
+
+
+def _columns(names, extra=()):
+    return list(dict.fromkeys([FIELDS[name] for name in names] + list(extra)))
+
+
+def _serialize(row, names):
+    item = {name: row[FIELDS[name]] for name in names}
+    if 'image' in item:
+        item['image'] = (
+            default_storage.url(item['image']) if item['image'] else None
+        )
+    return item
+
+
+def _stream(rows, names):
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield json.dumps(
+            _serialize(row, names), cls=DjangoJSONEncoder, ensure_ascii=False
+        ) + '\n'
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _feed(request, posts, scopes=(), keys=KEYS, extra=()):
+    """Лента страницей JSON по курсору или целиком потоком NDJSON
+    (?format=ndjson) начиная с курсора."""
+    try:
+        names = _fields(request)
+        limit = _limit(request)
+    except ValueError as error:
+        return _error(str(error))
+    validators = None
+    if scopes:
+        validators = Validators(request, list(scopes), extra)
+        not_modified = validators.not_modified()
+        if not_modified:
+            return not_modified
+    rows = posts.values(
+        *_columns(names, [key.lstrip('-') for key in keys])
+    )
+    paginator = KeysetPaginator(rows, limit, keys=keys)
+    cursor = request.GET.get('cursor')
+    if request.GET.get('format') == 'ndjson':
+        response = StreamingHttpResponse(
+            _stream(paginator.rest(cursor), names),
+            content_type='application/x-ndjson; charset=utf-8'
+        )
+    else:
+        page = paginator.get_page(cursor=cursor)
+        response = JsonResponse({
+            'results': [_serialize(row, names) for row in page],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        })
+    return validators.apply(response) if validators else response
+
+
+def index(request):
+    return _feed(request, Post.objects.all(), [versions.INDEX])
+
+
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    return _feed(
+        request,
+        Post.objects.filter(group=group),
+        [versions.group_scope(group.pk)]
+    )
+
+
+def profile(request, username):
+    user = get_object_or_404(User.objects.only('pk'), username=username)
+    return _feed(
+        request,
+        Post.objects.filter(author=user),
+        [versions.author_scope(user.pk)]
+    )
+
+
+def follow_index(request):
+    # API только читает уже разложенную ленту: дочитывание записей
+    # популярных авторов (запись в базу) делает HTML-страница ленты.
+    # ETag — по самой свежей записи ленты; правки и удаления записей
+    # учитывает версия INDEX.
+    if not request.user.is_authenticated:
+        return _error('Требуется авторизация', status=401)
+    posts = fanout.stored_feed(request.user).prefetch_related(None)
+    return _feed(
+        request, posts, [versions.INDEX], keys=FOLLOW_KEYS,
+        extra=[fanout.feed_marker(request.user)]
+    )
+
+
+def post_detail(request, post_id):
+    try:
+        names = _fields(request)
+    except ValueError as error:
+        return _error(str(error))
+    row = get_object_or_404(
+        Post.objects.values(*_columns(names, ['author_id'])), pk=post_id
+    )
+    validators = Validators(request, [
+        versions.post_scope(post_id), versions.author_scope(row['author_id'])
+    ])
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    return validators.apply(JsonResponse(_serialize(row, names)))
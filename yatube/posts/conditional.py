@@ -0,0 +1,80 @@
+import time
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import versions
+from .models import Comment, Post
+
+
+def _newest(queryset, field):
+    value = queryset.aggregate(last=Max(field))['last']
+    return int(value.timestamp()) if value is not None else 0
+
+
+def _scope_modified(scope):
+    """Время изменения области по базе: самая свежая запись или
+    комментарий. Нужно, только если отметки нет в кэше."""
+    kind, _, pk = scope.partition(':')
+    if kind == 'post':
+        return max(
+            _newest(Post.objects.filter(pk=pk), 'pub_date'),
+            _newest(Comment.objects.filter(post_id=pk), 'created'),
+        )
+    lookups = {
+        versions.INDEX: {},
+        'group': {'group_id': pk},
+        'author': {'author_id': pk},
+    }
+    if kind not in lookups:
+        # Для подписок времени в базе нет: считаем, что область
+        # изменилась только что.
+        return int(time.time())
+    return _newest(Post.objects.filter(**lookups[kind]), 'pub_date')
+
+
+def last_modified(scopes):
+    found = versions.get_modified(scopes)
+    for scope in scopes:
+        if scope not in found:
+            found[scope] = _scope_modified(scope)
+            versions.remember_modified(scope, found[scope])
+    return max(found.values())
+
+
+class Validators:
+    """ETag и Last-Modified страницы, собранной из областей scopes.
+
+    ETag строится из версий областей и учитывает пользователя: шапка
+    и кнопки подписки у каждого свои. Last-Modified отдаётся только
+    анонимам, чтобы If-Modified-Since без ETag не вернул 304
+    после входа на сайт. extra — дополнительные части ETag для
+    состояния, которое версиями областей не описывается.
+    """
+
+    def __init__(self, request, scopes, extra=()):
+        self.request = request
+        self.versions = versions.get_versions(scopes)
+        viewer = request.user.pk if request.user.is_authenticated else 0
+        self.etag = quote_etag('-'.join(
+            [str(viewer)]
+            + [str(self.versions[scope]) for scope in scopes]
+            + [str(part) for part in extra]
+        ))
+        self.last_modified = None
+        if not request.user.is_authenticated:
+            self.last_modified = last_modified(scopes)
+
+    def not_modified(self):
+        """Ответ 304, если у клиента актуальная копия, иначе None."""
+        response = get_conditional_response(
+            self.request, etag=self.etag, last_modified=self.last_modified
+        )
+        return response and self.apply(response)
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified)
+        return response
@@ -0,0 +1,94 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, Profile, User
+
+
+def _change(model, lookup, **deltas):
+    # Счётчик не уходит ниже нуля, даже если строки создавались
+    # в обход сигналов (bulk_create); такое расхождение чинит
+    # rebuild_counters.
+    return model.objects.filter(**lookup).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def change_profile(user_id, **deltas):
+    _change(Profile, {'user_id': user_id}, **deltas)
+
+
+def profile_of(user):
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        rebuild(Profile.objects.filter(pk=profile.pk))
+        profile.refresh_from_db()
+        return profile
+
+
+def post_added(post, delta=1):
+    change_profile(post.author_id, posts_count=delta)
+    if post.group_id is not None:
+        change_group(post.group_id, delta)
+
+
+def change_group(group_id, delta):
+    _change(Group, {'pk': group_id}, posts_count=delta)
+
+
+def comment_added(comment, delta=1):
+    _change(Post, {'pk': comment.post_id}, comments_count=delta)
+
+
+def follow_added(follow, delta=1):
+    change_profile(follow.author_id, followers_count=delta)
+    change_profile(follow.user_id, following_count=delta)
+
+
+def _count(model, **outer):
+    counted = model.objects.filter(
+        **{key: OuterRef(value) for key, value in outer.items()}
+    ).order_by().values(*outer).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), 0)
+
+
+def counter_specs():
+    """Для каждой денормализованной колонки — выражение с точным
+    значением, посчитанным по исходным таблицам."""
+    return [
+        (Profile, 'posts_count', _count(Post, author='user')),
+        (Profile, 'followers_count', _count(Follow, author='user')),
+        (Profile, 'following_count', _count(Follow, user='user')),
+        (Group, 'posts_count', _count(Post, group='pk')),
+        (Post, 'comments_count', _count(Comment, post='pk')),
+    ]
+
+
+def find_drift():
+    for model, field, actual in counter_specs():
+        rows = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).values_list('pk', field, 'actual')
+        for pk, stored, value in rows.iterator():
+            yield model, pk, field, stored, value
+
+
+def rebuild(queryset=None):
+    for model, field, actual in counter_specs():
+        if queryset is not None and queryset.model is not model:
+            continue
+        rows = queryset if queryset is not None else model.objects.all()
+        rows.update(**{field: actual})
+
+
+def users_without_profile():
+    return User.objects.filter(profile__isnull=True)
+
+
+def create_missing_profiles():
+    missing = users_without_profile().values_list('pk', flat=True)
+    Profile.objects.bulk_create(
+        [Profile(user_id=pk) for pk in missing], batch_size=500
+    )
@@ -0,0 +1,176 @@
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q
+
+from . import follow_graph, versions
+from .models import FeedEntry, Follow, Post
+
+# Авторы, у которых подписчиков не меньше этого числа, не раскладывают
+# свои записи по лентам при публикации: подписчики дочитывают их сами
+# при открытии ленты (fan-out-on-read).
+FANOUT_FOLLOWERS_LIMIT = 1000
+FEED_BACKFILL = 200
+BATCH_SIZE = 500
+PULL_AUTHORS_KEY = 'feed:pull_authors'
+
+
+def pull_author_ids():
+    author_ids = cache.get(PULL_AUTHORS_KEY)
+    if author_ids is None:
+        author_ids = set(
+            Follow.objects.values('author')
+            .annotate(followers=Count('pk'))
+            .filter(followers__gte=FANOUT_FOLLOWERS_LIMIT)
+            .values_list('author', flat=True)
+        )
+        cache.set(PULL_AUTHORS_KEY, author_ids, None)
+    return author_ids
+
+
+def forget_pull_authors():
+    versions.after_commit(lambda: cache.delete(PULL_AUTHORS_KEY))
+
+
+def _entries(user_ids, posts):
+    return [
+        FeedEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for user_id in user_ids
+        for post in posts
+    ]
+
+
+def fan_out_post(post):
+    if post.author_id in pull_author_ids():
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        _entries(follower_ids, [post]),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_ids, author_id):
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'pub_date'
+    )[:FEED_BACKFILL]
+    FeedEntry.objects.bulk_create(
+        _entries(user_ids, list(posts)),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def trim(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def follow_changed(author_id, created):
+    followers = Follow.objects.filter(author_id=author_id)
+    count = followers.count()
+    if created and count == FANOUT_FOLLOWERS_LIMIT:
+        forget_pull_authors()
+    elif not created and count == FANOUT_FOLLOWERS_LIMIT - 1:
+        # Автор вернулся к раскладке при записи: дозаполняем ленты тех,
+        # кто не успел дочитать его записи, пока он был «популярным».
+        forget_pull_authors()
+        backfill(list(followers.values_list('user_id', flat=True)),
+                 author_id)
+
+
+def pull(user):
+    author_ids = pull_author_ids()
+    if not author_ids:
+        return
+    followed = [
+        author_id for author_id in author_ids
+        if follow_graph.is_following(user.pk, author_id)
+    ]
+    if not followed:
+        return
+    # Отметка синхронизации у каждого автора своя: дозаполнение
+    # ленты при подписке на другого автора её не сдвигает.
+    synced = _watermarks(user, followed)
+    for author_id in followed:
+        if author_id not in synced:
+            backfill([user.pk], author_id)
+    if not synced:
+        return
+    # Всё, что строго позже отметки (pub_date, id), дочитывается
+    # пакетами без ограничения: пропущенные записи иначе не попали бы
+    # в ленту никогда. Если нового нет, лента только читается.
+    posts = Post.objects.filter(reduce(or_, [
+        Q(author_id=author_id, pub_date__gt=last)
+        | Q(author_id=author_id, pub_date=last, pk__gt=last_pk)
+        for author_id, (last, last_pk) in synced.items()
+    ])).order_by('pub_date', 'pk').only('pk', 'pub_date')
+    batch = []
+    for post in posts.iterator(chunk_size=BATCH_SIZE):
+        batch.append(post)
+        if len(batch) == BATCH_SIZE:
+            _save_pulled(user, batch)
+    if batch:
+        _save_pulled(user, batch)
+
+
+def _watermarks(user, author_ids):
+    """{автор: (pub_date, id)} последней записи автора в ленте."""
+    entries = FeedEntry.objects.filter(
+        user=user, post__author_id__in=author_ids
+    ).order_by().values('post__author_id')
+    last = dict(
+        entries.annotate(last=Max('pub_date'))
+        .values_list('post__author_id', 'last')
+    )
+    if not last:
+        return {}
+    last_pks = dict(
+        entries.filter(reduce(or_, [
+            Q(post__author_id=author_id, pub_date=pub_date)
+            for author_id, pub_date in last.items()
+        ])).annotate(last_pk=Max('post_id'))
+        .values_list('post__author_id', 'last_pk')
+    )
+    return {
+        author_id: (pub_date, last_pks[author_id])
+        for author_id, pub_date in last.items()
+    }
+
+
+def _save_pulled(user, batch):
+    FeedEntry.objects.bulk_create(
+        _entries([user.pk], batch), ignore_conflicts=True
+    )
+    batch.clear()
+
+
+def stored_feed(user):
+    """Лента из уже разложенных записей, без дочитывания: только
+    чтение."""
+    return Post.objects.feed().filter(feed_entries__user=user).annotate(
+        feed_pub_date=F('feed_entries__pub_date'),
+        feed_post_id=F('feed_entries__post_id'),
+    )
+
+
+def feed_marker(user):
+    """Отметка состояния ленты: самая свежая запись в ней и их
+    число. Меняется при раскладке, дочитывании, подписке и отписке."""
+    entries = FeedEntry.objects.filter(user=user)
+    newest = entries.order_by('-pub_date', '-post').values_list(
+        'pub_date', 'post_id'
+    ).first()
+    if newest is None:
+        return '0'
+    return f'{int(newest[0].timestamp())}.{newest[1]}.{entries.count()}'
+
+
+def follow_feed(user):
+    pull(user)
+    return stored_feed(user)
@@ -0,0 +1,48 @@
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from . import versions
+from .models import Follow, Profile
+
+# Подписки пользователя хранятся в кэше одним отсортированным массивом
+# id авторов: проверка подписки — бинарный поиск без запроса к базе.
+# При подписке и отписке массив сбрасывается и собирается заново при
+# следующем чтении, в том числе после фиксации транзакции.
+TIMEOUT = 60 * 60 * 24
+
+
+def _key(user_id):
+    return f'follow:following:{user_id}'
+
+
+def following_ids(user_id):
+    """Отсортированный array('q') id авторов, на которых подписан
+    пользователь."""
+    ids = cache.get(_key(user_id))
+    if ids is None:
+        ids = array('q', Follow.objects.filter(
+            user_id=user_id
+        ).order_by('author_id').values_list('author_id', flat=True))
+        cache.set(_key(user_id), ids, TIMEOUT)
+    return ids
+
+
+def is_following(user_id, author_id):
+    if not user_id or user_id == author_id:
+        return False
+    ids = following_ids(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def follower_count(user_id):
+    # Число подписчиков уже денормализовано в профиле (counters).
+    return Profile.objects.filter(user_id=user_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def invalidate(user_id):
+    versions.after_commit(lambda: cache.delete(_key(user_id)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Состаривает счета ленты «Популярное»; запускается '
+            'периодически, например по cron раз в несколько минут.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать счета заново по комментариям.',
+        )
+
+    def handle(self, *args, rebuild, **options):
+        if rebuild:
+            total = trending.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                f'Счета пересчитаны для записей: {total}'
+            ))
+            return
+        decayed, removed = trending.decay()
+        self.stdout.write(self.style.SUCCESS(
+            f'Состарено счетов: {decayed}, удалено угасших: {removed}'
+        ))
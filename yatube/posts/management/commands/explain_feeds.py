@@ -0,0 +1,96 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts import fanout, trending
+from posts.models import Comment, Group, Post, User
+from posts.paginator import KeysetPaginator, encode_cursor
+from posts.views import POST_NUMBER
+
+# Признаки плана, которые означают полный проход по таблице
+# или сортировку без индекса.
+SUSPICIOUS = {
+    'sqlite': re.compile(r'SCAN (TABLE )?\w+$|USE TEMP B-TREE'),
+    'postgresql': re.compile(r'Seq Scan|Sort'),
+    'mysql': re.compile(r'\bALL\b|Using filesort'),
+}
+# Страница по курсору должна начинать чтение индекса с границы:
+# обход индекса с начала с отсевом строк дорожает с глубиной.
+SUSPICIOUS_CURSOR = {
+    'sqlite': re.compile(r'\bSCAN\b'),
+    'postgresql': re.compile(r'^Filter:'),
+}
+CURSOR = ':cursor'
+
+
+class Command(BaseCommand):
+    help = ('Выводит EXPLAIN для запросов лент '
+            'и проверяет, что они идут по индексам.')
+
+    def feed_queries(self):
+        group = Group.objects.first()
+        author = User.objects.filter(posts__isnull=False).first()
+        follower = User.objects.filter(follower__isnull=False).first()
+        post = Post.objects.first()
+        ordering = ('-pub_date', '-pk')
+        queries = {
+            'index': (Post.objects.feed(), ordering),
+            'trending': (trending.feed(), trending.KEYS),
+        }
+        if group is not None:
+            queries['group_posts'] = (
+                Post.objects.feed().filter(group=group), ordering
+            )
+        if author is not None:
+            queries['profile'] = (
+                Post.objects.feed().filter(author=author), ordering
+            )
+        if follower is not None:
+            # Без дочитывания: команда ничего не пишет в базу.
+            queries['follow_index'] = (
+                fanout.stored_feed(follower),
+                ('-feed_pub_date', '-feed_post_id'),
+            )
+        if post is not None:
+            queries['post_detail'] = (
+                Comment.objects.filter(post=post), ('-created', '-pk')
+            )
+        pages = {}
+        for name, (queryset, keys) in queries.items():
+            paginator = KeysetPaginator(queryset, POST_NUMBER, keys=keys)
+            pages[name] = paginator.object_list[:POST_NUMBER + 1]
+            # Страница по курсору на первой записи: так читаются все
+            # страницы, кроме первой, и план не должен зависеть от
+            # глубины.
+            row = paginator.object_list.first()
+            if row is not None:
+                cursor = encode_cursor(
+                    [getattr(row, key.lstrip('-')) for key in keys]
+                )
+                pages[name + CURSOR] = (
+                    paginator.rest(cursor)[:POST_NUMBER + 1]
+                )
+        return pages
+
+    def handle(self, *args, **options):
+        markers = [SUSPICIOUS.get(connection.vendor)]
+        cursor_markers = markers + [SUSPICIOUS_CURSOR.get(connection.vendor)]
+        failed = []
+        for name, queryset in self.feed_queries().items():
+            plan = queryset.explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            checks = cursor_markers if name.endswith(CURSOR) else markers
+            problems = [
+                line for line in plan.splitlines()
+                if any(marker and marker.search(line.strip())
+                       for marker in checks)
+            ]
+            if problems:
+                failed.append(name)
+                for line in problems:
+                    self.stdout.write(self.style.WARNING(line.strip()))
+        if failed:
+            raise CommandError('Без индекса: ' + ', '.join(failed))
+        self.stdout.write(self.style.SUCCESS('Все ленты идут по индексам.'))
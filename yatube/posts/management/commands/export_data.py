@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает группы, записи, комментарии или подписки '
+            'в NDJSON или CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(transfer.COLUMNS))
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='Файл для выгрузки, по умолчанию стандартный вывод.',
+        )
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS, default='ndjson',
+        )
+
+    def handle(self, *args, model, output, format, **options):
+        stream = sys.stdout
+        if output != '-':
+            stream = open(output, 'w', encoding='utf-8', newline='')
+        done = 0
+        try:
+            rows = transfer.export_rows(model)
+            for done, _ in enumerate(
+                transfer.write_rows(rows, stream, format, model), 1
+            ):
+                if done % transfer.BATCH_SIZE == 0:
+                    self.stderr.write(f'Выгружено: {done}', ending='\r')
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        self.stderr.write(f'Выгружено строк ({model}): {done}')
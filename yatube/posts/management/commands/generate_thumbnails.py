@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Нарезает миниатюры для записей с картинками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Только для записей, у которых ещё нет миниатюр.',
+        )
+
+    def handle(self, *args, missing=False, **options):
+        posts = Post.objects.exclude(image='')
+        if missing:
+            posts = posts.filter(thumbnails__isnull=True)
+        done = 0
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            thumbnails.generate(post_id)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры готовы для записей: {done}'
+        ))
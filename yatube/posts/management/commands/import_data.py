@@ -0,0 +1,68 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает группы, записи, комментарии или подписки '
+            'из NDJSON или CSV. Загружайте в порядке: group, post, '
+            'comment, follow.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=list(transfer.COLUMNS))
+        parser.add_argument(
+            'path', help='Файл выгрузки или «-» для стандартного ввода.'
+        )
+        parser.add_argument(
+            '--format', choices=transfer.FORMATS,
+            help='По умолчанию определяется по расширению файла.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--create-users',
+            action='store_true',
+            help='Создавать отсутствующих пользователей без пароля.',
+        )
+        parser.add_argument(
+            '--no-rebuild',
+            action='store_true',
+            help=('Не пересчитывать счётчики, поиск и ленты; тогда '
+                  'запустите rebuild_counters и rebuild_search_index.'),
+        )
+
+    def handle(self, *args, model, path, format=None, batch_size,
+               create_users=False, no_rebuild=False, **options):
+        if format is None:
+            extension = os.path.splitext(path)[1].lstrip('.').lower()
+            format = 'csv' if extension == 'csv' else 'ndjson'
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        stream = sys.stdin
+        if path != '-':
+            stream = open(path, encoding='utf-8', newline='')
+
+        def progress(done, skipped):
+            self.stderr.write(
+                f'Загружено: {done}, пропущено: {skipped}', ending='\r'
+            )
+
+        try:
+            done, skipped = transfer.import_rows(
+                model,
+                transfer.read_rows(stream, format),
+                batch_size=batch_size,
+                create_users=create_users,
+                rebuild=not no_rebuild,
+                progress=progress,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк ({model}): {done}, пропущено: {skipped}'
+        ))
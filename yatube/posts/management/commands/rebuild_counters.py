@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счётчики с таблицами '
+            'и пересчитывает их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя.',
+        )
+
+    def handle(self, *args, check=False, **options):
+        drift = list(counters.find_drift())
+        for model, pk, field, stored, actual in drift:
+            self.stdout.write(
+                f'{model.__name__} {pk}: {field} = {stored}, '
+                f'должно быть {actual}'
+            )
+        missing = counters.users_without_profile().count()
+        if missing:
+            self.stdout.write(f'Пользователей без профиля: {missing}')
+        problems = len(drift) + missing
+        if check:
+            if problems:
+                raise CommandError(f'Расхождений: {problems}')
+            self.stdout.write(self.style.SUCCESS('Счётчики сходятся.'))
+            return
+        counters.create_missing_profiles()
+        counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны, исправлено расхождений: {problems}'
+        ))
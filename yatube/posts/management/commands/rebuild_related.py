@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import related
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает векторы TF-IDF всех записей и списки похожих '
+            'записей. Пока команда не запускалась, похожие записи '
+            'не считаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=related.BATCH_SIZE,
+        )
+
+    def handle(self, *args, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        total, truncated = related.rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие записи пересчитаны для записей: {total}'
+        ))
+        if truncated:
+            self.stdout.write(
+                f'Признаков, у которых учтены только {related.MAX_POSTING} '
+                f'записей с наибольшим весом: {truncated}'
+            )
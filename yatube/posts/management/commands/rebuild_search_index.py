@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс по всем записям.'
+
+    def handle(self, *args, **options):
+        search.rebuild()
+        backend = 'FTS5' if search.fts_enabled() else 'SearchTerm'
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс ({backend}) перестроен.'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации «кого почитать» для всех '
+            'пользователей по графу подписок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=recommendations.BATCH_SIZE,
+        )
+
+    def handle(self, *args, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        def progress(done, total):
+            self.stderr.write(f'Пересчитано: {done} из {total}', ending='\r')
+
+        total = recommendations.rebuild(
+            batch_size=batch_size, progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации пересчитаны для пользователей: {total}'
+        ))
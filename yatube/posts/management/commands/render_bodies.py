@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import rendering
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает HTML тел записей и комментариев, '
+            'отрендеренных прежней версией рендерера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=rendering.BATCH_SIZE,
+        )
+
+    def handle(self, *args, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        updated = rendering.rerender((Post, Comment), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            'Обновлено: ' + ', '.join(
+                f'{model} {count}' for model, count in updated.items()
+            )
+        ))
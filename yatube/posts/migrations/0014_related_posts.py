@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='related_posts',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
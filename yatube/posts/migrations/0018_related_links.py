@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:15
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_links(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    RelatedLink = apps.get_model('posts', 'RelatedLink')
+    existing = set(Post.objects.values_list('pk', flat=True))
+    lists = Post.objects.exclude(related_posts='').values_list(
+        'pk', 'related_posts'
+    )
+    RelatedLink.objects.bulk_create(
+        [
+            RelatedLink(post_id=pk, neighbour_id=entry['id'])
+            for pk, related_posts in lists.iterator()
+            for entry in json.loads(related_posts)
+            if entry['id'] in existing
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedLink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='relatedlink',
+            constraint=models.UniqueConstraint(fields=('post', 'neighbour'), name='unique_related_link'),
+        ),
+        migrations.RunPython(fill_links, migrations.RunPython.noop),
+    ]
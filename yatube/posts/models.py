@@ -1,13 +1,41 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from . import rendering
+
 User = get_user_model()
 
+FEED_FIELDS = (
+    'text',
+    'text_html',
+    'text_html_version',
+    'pub_date',
+    'image',
+    'views_count',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Записи для карточек ленты: всё, что читает includes/card.html,
+        достаётся одним запросом (миниатюры — ещё одним на страницу),
+        остальные колонки не загружаются."""
+        return self.select_related('author', 'group').only(
+            *FEED_FIELDS
+        ).prefetch_related('thumbnails')
+
 
 class Group(models.Model):
     slug = models.SlugField(unique=True)
     description = models.TextField()
     title = models.CharField(max_length=200)
+    posts_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
@@ -37,6 +65,15 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    views_count = models.PositiveIntegerField(default=0, editable=False)
+    text_html = models.TextField(blank=True, editable=False)
+    text_html_version = models.PositiveSmallIntegerField(
+        default=0, editable=False
+    )
+    related_posts = models.TextField(blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text
@@ -44,8 +81,31 @@ class Post(models.Model):
     def __repr__(self):
         return self.text[:100]
 
+    @property
+    def body_html(self):
+        return rendering.body_html(self)
+
+    @property
+    def related(self):
+        """Похожие записи, посчитанные posts.related."""
+        return json.loads(self.related_posts or '[]')
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -61,6 +121,22 @@ class Comment(models.Model):
     )
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    text_html = models.TextField(blank=True, editable=False)
+    text_html_version = models.PositiveSmallIntegerField(
+        default=0, editable=False
+    )
+
+    @property
+    def body_html(self):
+        return rendering.body_html(self)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'
+            )
+        ]
 
 
 class Follow(models.Model):
@@ -83,3 +159,195 @@ class Follow(models.Model):
                 name='unique_follow'
             )
         ]
+
+
+class Thumbnail(models.Model):
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='thumbnails'
+    )
+    name = models.CharField(max_length=32)
+    image = models.ImageField(
+        upload_to='thumbnails/',
+        width_field='width',
+        height_field='height'
+    )
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'name'],
+                name='unique_thumbnail'
+            )
+        ]
+
+
+class Profile(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='profile'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.user)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed'
+    )
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_post_idx'
+            )
+        ]
+
+
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='search_terms'
+    )
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'post'],
+                name='unique_search_term'
+            )
+        ]
+
+
+class Match(models.Lookup):
+    """Полнотекстовое условие FTS5: колонка MATCH запрос."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class SearchBodyField(models.TextField):
+    pass
+
+
+SearchBodyField.register_lookup(Match)
+
+
+class SearchIndex(models.Model):
+    """Виртуальная таблица FTS5 поиска на SQLite (миграция 0011).
+
+    Через связь с записью поиск ранжирует результаты соединением
+    с индексом; rank — скрытая колонка FTS5 со значением bm25()."""
+    post = models.OneToOneField(
+        'Post',
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index'
+    )
+    body = SearchBodyField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_search'
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_recommendation'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-score'],
+                name='recommendation_user_score_idx'
+            )
+        ]
+
+
+class PostScore(models.Model):
+    post = models.OneToOneField(
+        'Post',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score'
+    )
+    score = models.FloatField(default=0)
+    decayed = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-score', '-post'],
+                name='post_score_idx'
+            )
+        ]
+
+
+class RelatedLink(models.Model):
+    """Обратная ссылка из списка похожих: neighbour стоит в
+    Post.related_posts записи post. По индексу на neighbour при правке
+    и удалении записи находятся списки, где она упомянута."""
+    post = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='related_links'
+    )
+    neighbour = models.ForeignKey(
+        'Post',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'neighbour'],
+                name='unique_related_link'
+            )
+        ]
@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(values, direction=NEXT):
+    raw = json.dumps([direction] + [str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padding = '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(token + padding).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None, None
+    if (
+        not isinstance(data, list)
+        or len(data) < 2
+        or data[0] not in (NEXT, PREVIOUS)
+    ):
+        return None, None
+    return data[0], data[1:]
+
+
+class KeysetPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id) вместо OFFSET.
+
+    Страница по курсору стоит одинаково независимо от глубины:
+    выбирается per_page + 1 строк после (или до) граничной записи,
+    COUNT(*) не выполняется. Номера страниц (?page=) поддерживаются
+    как запасной вариант через обычный Paginator. Строками могут быть
+    и словари из values().
+    """
+
+    def __init__(self, object_list, per_page, keys=('-pub_date', '-pk'),
+                 **kwargs):
+        self.keys = tuple(keys)
+        super().__init__(object_list.order_by(*self.keys), per_page, **kwargs)
+
+    def get_page(self, number=None, cursor=None):
+        direction, values, queryset = self._seek(cursor)
+        if direction is None:
+            if number is None:
+                return self._get_keyset_page(None, NEXT, self.object_list)
+            page = super().get_page(number)
+            self._set_cursors(
+                page, page.has_previous(), page.has_next()
+            )
+            page.cache_key = f'page:{page.number}'
+            return page
+        return self._get_keyset_page(values, direction, queryset)
+
+    def _seek(self, cursor):
+        """(направление, значения ключа, записи за границей) по курсору
+        или три None, если курсор испорчен, подделан или не подходит
+        к ключу: такие курсоры открывают первую страницу."""
+        direction, values = decode_cursor(cursor) if cursor else (None, None)
+        if direction is None or len(values) != len(self.keys):
+            return None, None, None
+        try:
+            # Значения приводятся к типам полей при построении условия.
+            queryset = self.object_list.filter(
+                self._boundary_filter(values, direction)
+            )
+        except (ValidationError, ValueError, TypeError):
+            return None, None, None
+        return direction, values, queryset
+
+    def _field_names(self):
+        return [key.lstrip('-') for key in self.keys]
+
+    def _key_values(self, obj):
+        if isinstance(obj, dict):
+            return [obj[name] for name in self._field_names()]
+        return [getattr(obj, name) for name in self._field_names()]
+
+    def rest(self, cursor=None):
+        """Все записи после курсора (или с начала) без ограничения
+        страницей — для выгрузки потоком."""
+        direction, _, queryset = self._seek(cursor)
+        if direction != NEXT:
+            return self.object_list
+        return queryset
+
+    def _boundary_filter(self, values, direction):
+        # Для ключа (a, b) по убыванию «после» значит
+        # a < a0 OR (a = a0 AND b < b0); для PREVIOUS знаки меняются.
+        # По такому OR база не может начать чтение индекса с границы и
+        # идёт по нему с начала, поэтому первым идёт избыточное
+        # условие a <= a0: с ним страница на любой глубине — поиск
+        # по индексу.
+        condition = Q()
+        equal = {}
+        leading = None
+        for key, value in zip(self.keys, values):
+            name = key.lstrip('-')
+            descending = key.startswith('-')
+            lookup = 'lt' if descending == (direction == NEXT) else 'gt'
+            if leading is None:
+                leading = Q(**{f'{name}__{lookup}e': value})
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return leading & condition
+
+    def _get_keyset_page(self, values, direction, queryset):
+        if direction == PREVIOUS:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = values is not None, has_more
+        # Page вычисляет has_next/has_previous через number и num_pages,
+        # поэтому номер здесь относительный: 1 — первая страница ленты.
+        number = 2 if has_previous else 1
+        self.num_pages = number + 1 if has_next else number
+        page = Page(rows, number, self)
+        self._set_cursors(page, has_previous, has_next)
+        # Ключ для кэша фрагментов: только то, что выбрало страницу,
+        # без посторонних параметров запроса.
+        page.cache_key = (
+            encode_cursor(values, direction) if values is not None else ''
+        )
+        return page
+
+    def _set_cursors(self, page, has_previous, has_next):
+        rows = list(page.object_list)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = encode_cursor(self._key_values(rows[-1]), NEXT)
+        if rows and has_previous:
+            page.previous_cursor = encode_cursor(
+                self._key_values(rows[0]), PREVIOUS
+            )
@@ -0,0 +1,261 @@
+import heapq
+import logging
+import math
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+from . import versions
+from .models import Follow, Profile, Recommendation, User
+
+logger = logging.getLogger(__name__)
+
+# Рекомендации «кого почитать» по графу подписок F (строка — авторы,
+# на которых подписан пользователь). Оценка автора B для X:
+#   друзья друзей — строка X произведения F·F: сколько авторов X
+#   подписаны на B;
+#   совместные подписки — строка X произведения (F·Fᵀ)·F: на B
+#   подписаны похожие на X читатели, с весом по числу общих авторов
+#   и поправкой на популярность B.
+# Произведения считаются построчно по разреженным строкам (сортированные
+# массивы id), без матриц целиком.
+TOP_N = 10
+SIMILAR_USERS = 200
+FRIENDS_WEIGHT = 1.0
+COFOLLOW_WEIGHT = 0.5
+# При подписке пересчитываются и её подписчики, если их не больше
+# этого числа; остальных догонит пакетный пересчёт.
+INCREMENTAL_FOLLOWERS = 50
+# Сколько подписок на авторов пользователя читать при поиске похожих
+# читателей в пересчёте одного пользователя.
+READERS_LIMIT = 10000
+BATCH_SIZE = 500
+
+# Пересчёты после подписки идут по одному в фоновом потоке.
+_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix='recommendations'
+)
+
+
+class Graph:
+    """Разреженный граф подписок: строки F и Fᵀ в виде
+    отсортированных array('q')."""
+
+    def __init__(self, pairs):
+        following = defaultdict(list)
+        followers = defaultdict(list)
+        for user_id, author_id in pairs:
+            following[user_id].append(author_id)
+            followers[author_id].append(user_id)
+        self._following = {
+            user_id: array('q', sorted(ids))
+            for user_id, ids in following.items()
+        }
+        self._followers = {
+            author_id: array('q', sorted(ids))
+            for author_id, ids in followers.items()
+        }
+        self._scales = None
+
+    @classmethod
+    def load(cls):
+        """Весь граф одним потоковым запросом — для пакетного
+        пересчёта."""
+        return cls(Follow.objects.values_list(
+            'user_id', 'author_id'
+        ).iterator(chunk_size=10000))
+
+    @classmethod
+    def around(cls, user_ids):
+        """Часть графа, которая нужна для оценок пользователей
+        user_ids: четыре запроса на всех."""
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        pairs = set(follows.filter(user_id__in=user_ids))
+        followed = defaultdict(set)
+        for user_id, author_id in pairs:
+            followed[user_id].add(author_id)
+        authors = set().union(*followed.values())
+        pairs.update(follows.filter(user_id__in=authors))
+        readers = defaultdict(list)
+        # Самые свежие подписки: выборка не зависит от порядка строк
+        # в базе, и результат одинаков между запусками.
+        for reader, author_id in follows.filter(
+            author_id__in=authors
+        ).order_by('-pk')[:READERS_LIMIT]:
+            pairs.add((reader, author_id))
+            readers[author_id].append(reader)
+        similar = set()
+        for user_id in user_ids:
+            common = Counter()
+            for author_id in followed[user_id]:
+                common.update(readers[author_id])
+            common.pop(user_id, None)
+            similar.update(
+                reader for reader, _ in common.most_common(SIMILAR_USERS)
+            )
+        pairs.update(follows.filter(user_id__in=similar))
+        return cls(pairs)
+
+    def users(self):
+        return self._following.keys()
+
+    def following(self, user_id):
+        return self._following.get(user_id, ())
+
+    def followers(self, author_id):
+        return self._followers.get(author_id, ())
+
+    def scales(self):
+        """Множители совместных подписок по всему графу: считаются
+        один раз на пакетный пересчёт, а не для каждого кандидата."""
+        if self._scales is None:
+            self._scales = _scales({
+                author_id: len(ids)
+                for author_id, ids in self._followers.items()
+            })
+        return self._scales
+
+
+def _scales(counts):
+    """Множители совместных подписок: вес с поправкой на популярность
+    автора (корень из числа подписчиков)."""
+    return {
+        pk: COFOLLOW_WEIGHT / math.sqrt(max(count, 1))
+        for pk, count in counts.items()
+    }
+
+
+def _follower_scales(candidates):
+    # В части графа вокруг пользователя подписчики неполные: берём
+    # денормализованные счётчики профилей.
+    return _scales(dict(Profile.objects.filter(
+        user_id__in=candidates
+    ).values_list('user_id', 'followers_count')))
+
+
+def _weights(user_id, graph):
+    followed = set(graph.following(user_id))
+    friends = Counter()
+    for author_id in followed:
+        friends.update(graph.following(author_id))
+    similar = Counter()
+    for author_id in followed:
+        similar.update(graph.followers(author_id))
+    similar.pop(user_id, None)
+    cofollow = Counter()
+    for reader, common in similar.most_common(SIMILAR_USERS):
+        for author_id in graph.following(reader):
+            cofollow[author_id] += common
+    candidates = (friends.keys() | cofollow.keys()) - followed - {user_id}
+    return friends, cofollow, candidates
+
+
+def _rank(friends, cofollow, candidates, scales):
+    # dict.get, а не Counter[...]: отсутствующий ключ у Counter
+    # обрабатывается вызовом __missing__ на Python, а кандидатов
+    # у пользователя тысячи.
+    best = heapq.nlargest(TOP_N, (
+        (
+            FRIENDS_WEIGHT * friends.get(pk, 0)
+            + cofollow.get(pk, 0) * scales.get(pk, COFOLLOW_WEIGHT),
+            -pk,
+        )
+        for pk in candidates
+    ))
+    return [(-negative, score) for score, negative in best]
+
+
+def scores(user_id, graph, exact_counts=False):
+    """Лучшие TOP_N пар (автор, оценка) для пользователя."""
+    friends, cofollow, candidates = _weights(user_id, graph)
+    if exact_counts:
+        scales = _follower_scales(candidates)
+    else:
+        scales = graph.scales()
+    return _rank(friends, cofollow, candidates, scales)
+
+
+def store(results):
+    """Заменяет сохранённые рекомендации пользователей из results
+    ({user_id: [(автор, оценка), ...]})."""
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=list(results)).delete()
+        Recommendation.objects.bulk_create([
+            Recommendation(user_id=user_id, author_id=author_id, score=score)
+            for user_id, ranked in results.items()
+            for author_id, score in ranked
+        ])
+    # Блок рекомендаций на собственном профиле входит в его ETag.
+    versions.bump(*[versions.follow_scope(pk) for pk in results])
+
+
+def rebuild(batch_size=BATCH_SIZE, progress=None):
+    """Пакетный пересчёт для всех пользователей; возвращает их число."""
+    graph = Graph.load()
+    user_ids = list(
+        User.objects.order_by('pk').values_list('pk', flat=True)
+    )
+    for start in range(0, len(user_ids), batch_size):
+        chunk = user_ids[start:start + batch_size]
+        store({user_id: scores(user_id, graph) for user_id in chunk})
+        if progress is not None:
+            progress(start + len(chunk), len(user_ids))
+    return len(user_ids)
+
+
+def update(user_ids):
+    """Пересчёт для нескольких пользователей по одной части графа
+    и одному чтению счётчиков подписчиков."""
+    graph = Graph.around(user_ids)
+    weights = {user_id: _weights(user_id, graph) for user_id in user_ids}
+    scales = _follower_scales(set().union(
+        *[candidates for _, _, candidates in weights.values()]
+    ))
+    store({
+        user_id: _rank(friends, cofollow, candidates, scales)
+        for user_id, (friends, cofollow, candidates) in weights.items()
+    })
+
+
+def follow_changed_now(user_id):
+    """Пересчитывает user_id и, если их немного, тех, кто подписан
+    на него (у них поменялись друзья друзей)."""
+    readers = list(Follow.objects.filter(
+        author_id=user_id
+    ).values_list('user_id', flat=True)[:INCREMENTAL_FOLLOWERS + 1])
+    if len(readers) > INCREMENTAL_FOLLOWERS:
+        readers = []
+    update([user_id, *readers])
+
+
+def _run(user_id):
+    try:
+        follow_changed_now(user_id)
+    except Exception:
+        logger.exception('Не удалось пересчитать рекомендации %s', user_id)
+    finally:
+        connection.close()
+
+
+def follow_changed(user_id):
+    """Подписка user_id изменилась: пересчёт идёт в фоне после
+    фиксации транзакции и не задерживает ответ."""
+    transaction.on_commit(lambda: _executor.submit(_run, user_id))
+
+
+def for_user(user, limit=TOP_N):
+    """Авторы, которых стоит предложить пользователю: одно чтение
+    готовой таблицы, без обхода графа."""
+    if not user.is_authenticated:
+        return []
+    return [
+        recommendation.author
+        for recommendation in Recommendation.objects.filter(
+            user=user
+        ).select_related('author').only(
+            'author', 'author__username', 'author__first_name',
+            'author__last_name'
+        ).order_by('-score', 'author_id')[:limit]
+    ]
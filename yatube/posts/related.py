@@ -0,0 +1,388 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.utils.text import Truncator
+
+from . import search, versions
+from .models import Post, RelatedLink
+
+# Похожие записи по векторам TF-IDF текста. Термины (основы слов из
+# search.terms) хэшируются в DIMENSIONS признаков, у записи остаются
+# FEATURES самых весомых; вектор нормирован, сходство — косинус.
+# Соседи считаются заранее и лежат в Post.related_posts, так что
+# страница записи получает их тем же запросом, что и саму запись.
+DIMENSIONS = 1 << 20
+FEATURES = 32
+NEIGHBOURS = 5
+CANDIDATES = 100
+QUERY_TERMS = 10
+TITLE_LENGTH = 80
+BATCH_SIZE = 1000
+# В пакетном пересчёте от признака, который есть у большего числа
+# записей, остаются MAX_POSTING записей, где он весит больше всего.
+# Кандидаты с таким признаком пересчитываются точным косинусом.
+MAX_POSTING = 1000
+
+MATRIX_FILE = 'vectors.bin'
+FREQUENCIES_FILE = 'df.bin'
+# Строка матрицы: число признаков, их номера и веса.
+ROW = struct.Struct(f'<I{FEATURES}I{FEATURES}f')
+
+
+class Store:
+    """Матрица векторов и частоты признаков на диске.
+
+    Строка записи лежит по смещению pk * ROW.size, поэтому вектор
+    читается одним срезом отображённого в память файла. Частоты —
+    массив из DIMENSIONS + 1 счётчиков, нулевой хранит число записей.
+    Воркеры меняют файлы без блокировок: частоты при этом могут
+    немного разойтись, их выравнивает пакетный пересчёт.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.matrix_path = os.path.join(root, MATRIX_FILE)
+        self.frequencies_path = os.path.join(root, FREQUENCIES_FILE)
+        self._lock = threading.Lock()
+        self._matrix = self._matrix_inode = None
+        self._frequencies = self._frequencies_inode = None
+
+    def exists(self):
+        return os.path.exists(self.frequencies_path)
+
+    def _replace(self, path, content):
+        # Новый файл подменяет старый целиком: отображения старого
+        # в других процессах остаются целыми и замечают подмену по inode.
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as stream:
+            stream.write(content)
+        os.replace(temporary, path)
+
+    def create(self, total, frequencies):
+        os.makedirs(self.root, exist_ok=True)
+        counts = [0] * (DIMENSIONS + 1)
+        counts[0] = total
+        for index, count in frequencies.items():
+            counts[index + 1] = count
+        self._replace(self.matrix_path, b'')
+        self._replace(
+            self.frequencies_path,
+            struct.pack(f'<{DIMENSIONS + 1}I', *counts)
+        )
+
+    def frequencies(self):
+        inode = os.stat(self.frequencies_path).st_ino
+        with self._lock:
+            if self._frequencies is None or self._frequencies_inode != inode:
+                with open(self.frequencies_path, 'r+b') as stream:
+                    mapped = mmap.mmap(stream.fileno(), 0)
+                    inode = os.fstat(stream.fileno()).st_ino
+                self._frequencies = memoryview(mapped).cast('I')
+                self._frequencies_inode = inode
+            return self._frequencies
+
+    def add_document(self, indexes):
+        counts = self.frequencies()
+        counts[0] += 1
+        for index in indexes:
+            counts[index + 1] += 1
+
+    def read(self, pk):
+        start = pk * ROW.size
+        stat = os.stat(self.matrix_path)
+        if stat.st_size < start + ROW.size:
+            return {}
+        with self._lock:
+            # Файл растёт дозаписью: отображение перечитывается, когда
+            # строки в нём ещё нет или файл подменён пересчётом.
+            if (
+                self._matrix is None
+                or self._matrix_inode != stat.st_ino
+                or len(self._matrix) < start + ROW.size
+            ):
+                with open(self.matrix_path, 'rb') as stream:
+                    self._matrix = mmap.mmap(
+                        stream.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+                    self._matrix_inode = os.fstat(stream.fileno()).st_ino
+            if len(self._matrix) < start + ROW.size:
+                return {}
+            values = ROW.unpack_from(self._matrix, start)
+        count = values[0]
+        return dict(zip(
+            values[1:1 + count], values[1 + FEATURES:1 + FEATURES + count]
+        ))
+
+    def write(self, vectors):
+        with open(self.matrix_path, 'r+b') as stream:
+            for pk, vector in vectors.items():
+                items = sorted(vector.items())
+                padding = FEATURES - len(items)
+                os.pwrite(stream.fileno(), ROW.pack(
+                    len(items),
+                    *[index for index, _ in items], *[0] * padding,
+                    *[weight for _, weight in items], *[0.0] * padding,
+                ), pk * ROW.size)
+
+
+_stores = {}
+
+
+def current_store():
+    root = settings.RELATED_ROOT
+    if root not in _stores:
+        _stores[root] = Store(root)
+    return _stores[root]
+
+
+def features(text):
+    return Counter(
+        zlib.crc32(term.encode()) % DIMENSIONS for term in search.terms(text)
+    )
+
+
+def weigh(counts, frequencies):
+    total = frequencies[0]
+    weights = {
+        index: (1 + math.log(count)) * (
+            math.log((1 + total) / (1 + frequencies[index + 1])) + 1
+        )
+        for index, count in counts.items()
+    }
+    top = heapq.nlargest(
+        FEATURES, weights.items(), key=lambda item: (item[1], -item[0])
+    )
+    norm = math.sqrt(sum(weight * weight for _, weight in top)) or 1.0
+    return {index: weight / norm for index, weight in top}
+
+
+def cosine(first, second):
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(
+        weight * second.get(index, 0.0) for index, weight in first.items()
+    )
+
+
+def _best(scored):
+    return heapq.nlargest(
+        NEIGHBOURS,
+        [item for item in scored if item[1] > 0],
+        key=lambda item: (item[1], -item[0])
+    )
+
+
+def _entry(pk, text, score):
+    return {
+        'id': pk,
+        'text': Truncator(text).chars(TITLE_LENGTH),
+        'score': round(score, 4),
+    }
+
+
+def _dump(entries):
+    return json.dumps(entries, ensure_ascii=False)
+
+
+def _holders(pk):
+    """Записи, в списках соседей которых есть pk: по обратным ссылкам
+    RelatedLink и индексу на neighbour."""
+    return Post.objects.only('related_posts').filter(
+        related_links__neighbour_id=pk
+    )
+
+
+def _link(lists):
+    """Заменяет обратные ссылки записей из lists ({id: список})."""
+    RelatedLink.objects.filter(post_id__in=list(lists)).delete()
+    RelatedLink.objects.bulk_create([
+        RelatedLink(post_id=pk, neighbour_id=entry['id'])
+        for pk, entries in lists.items()
+        for entry in entries
+    ])
+
+
+def _write(lists):
+    """Сохраняет списки соседей ({id: список}) вместе с обратными
+    ссылками; возвращает id записей."""
+    for pk, entries in lists.items():
+        Post.objects.filter(pk=pk).update(related_posts=_dump(entries))
+    _link(lists)
+    return list(lists)
+
+
+def _without(pk, holders):
+    """Списки соседей holders без pk."""
+    return {
+        holder.pk: [entry for entry in holder.related if entry['id'] != pk]
+        for holder in holders
+    }
+
+
+def refresh(post, created=False):
+    """Пересчитывает соседей сохранённой записи и добавляет её в списки
+    соседей, где она сильнее самой слабой."""
+    store = current_store()
+    if not store.exists():
+        # Матрицы ещё нет: её создаёт rebuild_related.
+        return
+    counts = features(post.text)
+    if created:
+        store.add_document(counts)
+    vector = weigh(counts, store.frequencies())
+    store.write({post.pk: vector})
+    terms = [
+        term for term, _ in Counter(search.terms(post.text)).most_common(
+            QUERY_TERMS
+        )
+    ]
+    best = _best(
+        (pk, cosine(vector, store.read(pk)))
+        for pk in search.similar_ids(terms, CANDIDATES + 1) if pk != post.pk
+    )
+    neighbours = Post.objects.only('text', 'related_posts').in_bulk(
+        [pk for pk, _ in best]
+    )
+    lists = {post.pk: [
+        _entry(pk, neighbours[pk].text, score)
+        for pk, score in best if pk in neighbours
+    ]}
+    if not created:
+        # После правки запись могла перестать быть похожей на
+        # прежних соседей.
+        keep = {pk for pk, _ in best}
+        lists.update(_without(post.pk, [
+            holder for holder in _holders(post.pk) if holder.pk not in keep
+        ]))
+    for pk, score in best:
+        if pk not in neighbours:
+            continue
+        before = neighbours[pk].related
+        entries = [entry for entry in before if entry['id'] != post.pk]
+        entries.append(_entry(post.pk, post.text, score))
+        entries.sort(key=lambda entry: (-entry['score'], entry['id']))
+        entries = entries[:NEIGHBOURS]
+        if entries != before:
+            lists[pk] = entries
+    changed = _write(lists)
+    versions.bump(*[versions.post_scope(pk) for pk in changed])
+
+
+def forget(post):
+    """Убирает удаляемую запись из списков соседей. Вызывается до
+    удаления: потом каскад уже сотрёт обратные ссылки на неё."""
+    store = current_store()
+    if store.exists():
+        store.write({post.pk: {}})
+    changed = _write(_without(post.pk, _holders(post.pk)))
+    versions.bump(*[versions.post_scope(pk) for pk in changed])
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Пакетный пересчёт: частоты, матрица векторов и соседи всех
+    записей. Соседи ищутся построчным произведением V·Vᵀ через
+    обратный индекс признаков. Тексты читаются потоком в три прохода,
+    векторы лежат только в матрице; в памяти держится лишь обратный
+    индекс. Возвращает число записей и число укороченных списков
+    признаков."""
+    rows = Post.objects.order_by('pk').values_list('pk', 'text')
+    total = 0
+    frequencies = Counter()
+    for _, text in rows.iterator(chunk_size=batch_size):
+        frequencies.update(features(text).keys())
+        total += 1
+    store = current_store()
+    store.create(total, frequencies)
+    del frequencies
+    total_frequencies = store.frequencies()
+    postings = defaultdict(lambda: (array('q'), array('f')))
+    for chunk in _chunks(rows.iterator(chunk_size=batch_size), batch_size):
+        vectors = {
+            pk: weigh(features(text), total_frequencies)
+            for pk, text in chunk
+        }
+        store.write(vectors)
+        for pk, vector in vectors.items():
+            for index, weight in vector.items():
+                ids, weights = postings[index]
+                ids.append(pk)
+                weights.append(weight)
+    truncated = _truncate(postings)
+    pks = Post.objects.order_by('pk').values_list('pk', flat=True)
+    for chunk in _chunks(pks.iterator(chunk_size=batch_size), batch_size):
+        best = {pk: _neighbours(pk, store, postings, truncated)
+                for pk in chunk}
+        titles = Post.objects.only('text').in_bulk({
+            other for ranked in best.values() for other, _ in ranked
+        })
+        _save([
+            Post(pk=pk, related_posts=_dump([
+                _entry(other, titles[other].text, score)
+                for other, score in ranked if other in titles
+            ]))
+            for pk, ranked in best.items()
+        ])
+    return total, len(truncated)
+
+
+def _truncate(postings):
+    """Оставляет в длинных списках признаков MAX_POSTING записей
+    с наибольшим весом; возвращает множество укороченных признаков."""
+    truncated = set()
+    for index, (ids, weights) in postings.items():
+        if len(ids) > MAX_POSTING:
+            top = heapq.nlargest(MAX_POSTING, zip(weights, ids))
+            postings[index] = (
+                array('q', [pk for _, pk in top]),
+                array('f', [weight for weight, _ in top]),
+            )
+            truncated.add(index)
+    return truncated
+
+
+def _neighbours(pk, store, postings, truncated):
+    vector = store.read(pk)
+    # defaultdict, а не Counter: у Counter отсутствующий ключ
+    # обрабатывает __missing__ на Python, а почти все ключи новые.
+    scores = defaultdict(float)
+    for index, weight in vector.items():
+        ids, weights = postings.get(index, ((), ()))
+        for other, other_weight in zip(ids, weights):
+            scores[other] += weight * other_weight
+    scores.pop(pk, None)
+    if truncated.isdisjoint(vector):
+        return _best(scores.items())
+    # Через укороченные списки сходство недосчитано: лучших
+    # по частичной сумме кандидатов сравниваем по векторам целиком.
+    candidates = heapq.nlargest(
+        CANDIDATES, scores.items(), key=lambda item: (item[1], -item[0])
+    )
+    return _best(
+        (other, cosine(vector, store.read(other)))
+        for other, _ in candidates
+    )
+
+
+def _save(batch):
+    Post.objects.bulk_update(batch, ['related_posts'])
+    _link({post.pk: post.related for post in batch})
+    versions.bump(*[versions.post_scope(post.pk) for post in batch])
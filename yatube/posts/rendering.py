@@ -0,0 +1,54 @@
+from django.template.defaultfilters import linebreaks_filter
+from django.utils.safestring import mark_safe
+
+# Меняйте при любой правке render_text(): тела со старой версией
+# перестают браться из базы и пересобираются командой render_bodies.
+RENDERER_VERSION = 1
+BATCH_SIZE = 500
+
+
+def render_text(text):
+    """HTML тела записи или комментария: экранированный текст
+    с абзацами и переносами строк."""
+    return linebreaks_filter(text, autoescape=True)
+
+
+def fill(obj):
+    obj.text_html = render_text(obj.text)
+    obj.text_html_version = RENDERER_VERSION
+
+
+def body_html(obj):
+    """Готовый HTML из базы; если он собран старой версией
+    рендерера, тело рендерится на лету."""
+    if obj.text_html_version == RENDERER_VERSION:
+        return mark_safe(obj.text_html)
+    return render_text(obj.text)
+
+
+def stale(model):
+    return model.objects.exclude(text_html_version=RENDERER_VERSION)
+
+
+def rerender(models, batch_size=BATCH_SIZE):
+    """Пересобирает тела, отрендеренные другой версией;
+    возвращает число обновлённых строк по моделям."""
+    updated = {}
+    for model in models:
+        count = 0
+        batch = []
+        for obj in stale(model).only('text').iterator(chunk_size=batch_size):
+            fill(obj)
+            batch.append(obj)
+            if len(batch) == batch_size:
+                count += _save(model, batch)
+        count += _save(model, batch)
+        updated[model.__name__] = count
+    return updated
+
+
+def _save(model, batch):
+    model.objects.bulk_update(batch, ['text_html', 'text_html_version'])
+    count = len(batch)
+    batch.clear()
+    return count
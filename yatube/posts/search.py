@@ -0,0 +1,222 @@
+import math
+import re
+from collections import Counter
+
+from django.db import connection
+from django.db.models import (Case, Count, F, FloatField, Sum, Value,
+                              When)
+
+from .models import Post, SearchIndex, SearchTerm
+
+FTS_TABLE = 'posts_search'
+SEARCH_LIMIT = 500
+
+WORD = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+RV = re.compile(f'^(.*?[{VOWELS}])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|'
+    r'их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|'
+    r'ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(
+    f'.*[^{VOWELS}]+[{VOWELS}]+[^{VOWELS}]+[{VOWELS}].*ость?$'
+)
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+ENGLISH_SUFFIX = re.compile(r"(?<=\w{3})('s|ing|ed|es|s)$")
+
+
+def stem_russian(word):
+    """Стеммер Портера (Snowball) для русского языка."""
+    match = RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            stripped = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            if stripped == rv:
+                stripped = NOUN.sub('', rv, 1)
+    rv = stripped
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL.match(rv):
+        rv = re.sub('ость?$', '', rv)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return start + rv
+
+
+def stem(word):
+    if re.search('[а-я]', word):
+        return stem_russian(word)
+    return ENGLISH_SUFFIX.sub('', word)
+
+
+def terms(text):
+    words = WORD.findall(text.lower().replace('ё', 'е'))
+    return [stem(word)[:64] for word in words if len(word) > 1]
+
+
+_fts_enabled = None
+
+
+def fts_enabled():
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_enabled
+
+
+def index_post(post):
+    words = terms(post.text)
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, body) VALUES (%s, %s)',
+                [post.pk, ' '.join(words)]
+            )
+        return
+    SearchTerm.objects.filter(post_id=post.pk).delete()
+    counts = Counter(words)
+    total = sum(counts.values()) or 1
+    SearchTerm.objects.bulk_create(
+        [
+            SearchTerm(term=term, post_id=post.pk, weight=count / total)
+            for term, count in counts.items()
+        ],
+        batch_size=500
+    )
+
+
+def unindex_post(post_id):
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+    else:
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+
+def _fts_search(query_terms):
+    expression = ' '.join(
+        '"{}"'.format(term.replace('"', '""')) for term in query_terms
+    )
+    # Кандидаты — SEARCH_LIMIT лучших по индексу, релевантность берётся
+    # соединением с ним же. bm25() тем меньше, чем лучше совпадение.
+    best = SearchIndex.objects.filter(body__match=expression).order_by(
+        'rank'
+    ).values('post_id')[:SEARCH_LIMIT]
+    return Post.objects.feed().filter(
+        pk__in=best, search_index__body__match=expression
+    ).annotate(rank=-F('search_index__rank'))
+
+
+def _inverted_index_search(query_terms):
+    frequency = dict(
+        SearchTerm.objects.filter(term__in=query_terms).order_by()
+        .values('term').annotate(posts=Count('pk'))
+        .values_list('term', 'posts')
+    )
+    if len(frequency) < len(query_terms):
+        return None
+    total = Post.objects.count()
+
+    def ranked(posts):
+        # Сумма tf * idf по терминам запроса; записи, где есть
+        # не все термины, отсекает HAVING.
+        return posts.filter(search_terms__term__in=query_terms).annotate(
+            rank=Sum(Case(
+                *[When(search_terms__term=term,
+                       then=F('search_terms__weight')
+                       * Value(math.log(1 + total / count)))
+                  for term, count in frequency.items()],
+                output_field=FloatField()
+            )),
+            found=Count('search_terms'),
+        ).filter(found=len(query_terms))
+
+    best = ranked(Post.objects.all()).order_by('-rank', '-pk').values(
+        'pk'
+    )[:SEARCH_LIMIT]
+    return ranked(Post.objects.feed()).filter(pk__in=best)
+
+
+def similar_ids(query_terms, limit):
+    """id записей, где есть хотя бы один из терминов, по убыванию
+    релевантности (в отличие от search(), где нужны все термины)."""
+    query_terms = sorted(set(query_terms))
+    if not query_terms:
+        return []
+    if fts_enabled():
+        expression = ' OR '.join(
+            '"{}"'.format(term.replace('"', '""')) for term in query_terms
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s',
+                [expression, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    return list(
+        SearchTerm.objects.filter(term__in=query_terms)
+        .values('post_id')
+        .annotate(score=Sum('weight'))
+        .order_by('-score')
+        .values_list('post_id', flat=True)[:limit]
+    )
+
+
+def search(query):
+    """Записи, подходящие под запрос, с релевантностью в поле rank."""
+    query_terms = sorted(set(terms(query)))
+    posts = None
+    if query_terms and fts_enabled():
+        posts = _fts_search(query_terms)
+    elif query_terms:
+        posts = _inverted_index_search(query_terms)
+    if posts is None:
+        return Post.objects.none().annotate(
+            rank=Value(0.0, output_field=FloatField())
+        )
+    return posts
+
+
+def rebuild():
+    if fts_enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    else:
+        SearchTerm.objects.all().delete()
+    for post in Post.objects.only('text').iterator():
+        index_post(post)
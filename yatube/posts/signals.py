@@ -0,0 +1,170 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (counters, fanout, follow_graph, recommendations, related,
+               rendering, search, trending, versions)
+from .models import Comment, Follow, Group, Post, Profile, User
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        fanout.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        fanout.backfill([instance.user_id], instance.author_id)
+        fanout.follow_changed(instance.author_id, created=True)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_feed(sender, instance, **kwargs):
+    fanout.trim(instance.user_id, instance.author_id)
+    fanout.follow_changed(instance.author_id, created=False)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def render_body(sender, instance, update_fields=None, **kwargs):
+    # Частичные сохранения (update_fields) тело не трогают.
+    if update_fields is None:
+        rendering.fill(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    instance._previous_group_id = None
+    if instance.pk is not None:
+        instance._previous_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    scopes = [
+        versions.INDEX,
+        versions.author_scope(instance.author_id),
+        versions.post_scope(instance.pk),
+    ]
+    for group_id in (
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    ):
+        if group_id is not None:
+            scopes.append(versions.group_scope(group_id))
+    versions.bump(*scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_fragments(sender, instance, **kwargs):
+    versions.bump(versions.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    versions.bump(versions.group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    # Счётчики подписок и кнопка «Подписаться» на страницах обоих.
+    versions.bump(
+        versions.follow_scope(instance.user_id),
+        versions.follow_scope(instance.author_id),
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_following(sender, instance, **kwargs):
+    follow_graph.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def refresh_recommendations(sender, instance, **kwargs):
+    recommendations.follow_changed(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        counters.post_added(instance)
+        return
+    previous = getattr(instance, '_previous_group_id', None)
+    if previous != instance.group_id:
+        if previous is not None:
+            counters.change_group(previous, -1)
+        if instance.group_id is not None:
+            counters.change_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.post_added(instance, delta=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.comment_added(instance, delta=-1)
+
+
+@receiver(post_save, sender=Comment)
+def score_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        trending.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def score_deleted_comment(sender, instance, **kwargs):
+    trending.comment_removed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.follow_added(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.follow_added(instance, delta=-1)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def refresh_related(sender, instance, created, **kwargs):
+    # После index_post: кандидаты в соседи ищутся по поисковому индексу.
+    related.refresh(instance, created)
+
+
+@receiver(pre_delete, sender=Post)
+def forget_related(sender, instance, **kwargs):
+    related.forget(instance)
@@ -0,0 +1,11 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def rendition(post, name):
+    for thumbnail in post.thumbnails.all():
+        if thumbnail.name == name:
+            return thumbnail
+    return None
@@ -0,0 +1,31 @@
+import re
+
+from django import template
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+COUNTER = re.compile(r'<span data-post-views="(\d+)">\d+</span>')
+
+
+@register.simple_tag
+def views_count(post):
+    return format_html(
+        '<span data-post-views="{}">{}</span>', post.pk, post.views_count
+    )
+
+
+@register.filter(is_safe=True)
+def fresh_views(html, posts):
+    """Подставляет в закэшированный фрагмент ленты текущие счётчики
+    просмотров записей posts: сброс просмотров не вытесняет кэш
+    страниц."""
+    counts = {str(post.pk): post.views_count for post in posts}
+
+    def replace(match):
+        count = counts.get(match[1])
+        if count is None:
+            return match[0]
+        return f'<span data-post-views="{match[1]}">{count}</span>'
+    return mark_safe(COUNTER.sub(replace, html))
@@ -0,0 +1,277 @@
+import os
+import re
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import fanout, follow_graph, recommendations, rendering
+from ..management.commands import explain_feeds
+from ..models import (Comment, FeedEntry, Follow, Group, Post, PostScore,
+                      Recommendation, User)
+from ..paginator import KeysetPaginator
+
+
+class ExplainFeedsCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(
+            user=User.objects.create_user(username='reader'),
+            author=cls.user
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Текст'
+        )
+        Comment.objects.create(post=cls.post, author=cls.user, text='Текст')
+
+    def test_feeds_use_indexes(self):
+        """Запросы всех лент идут по индексам."""
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        output = out.getvalue()
+        for name in ('index', 'trending', 'group_posts', 'profile',
+                     'follow_index', 'post_detail'):
+            with self.subTest(name=name):
+                self.assertIn(name, output)
+                self.assertIn(name + explain_feeds.CURSOR, output)
+        self.assertIn('Все ленты идут по индексам.', output)
+
+    def test_command_does_not_write(self):
+        """Команда только читает: лента подписок не дочитывается."""
+        cache.clear()
+        FeedEntry.objects.all().delete()
+        with mock.patch.object(fanout, 'FANOUT_FOLLOWERS_LIMIT', 1):
+            with CaptureQueriesContext(connection) as queries:
+                call_command('explain_feeds', stdout=StringIO())
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+
+    def test_cursor_page_must_seek(self):
+        """Страница по курсору, которая обходит индекс с начала,
+        считается ошибкой, хотя для первой страницы это нормально."""
+        with mock.patch.object(KeysetPaginator, 'rest',
+                               lambda self, cursor: self.object_list):
+            with self.assertRaisesRegex(CommandError, 'index:cursor'):
+                call_command('explain_feeds', stdout=StringIO())
+
+    def test_bad_plan_fails_command(self):
+        """Запрос без индекса завершает команду ошибкой."""
+        with mock.patch.dict(explain_feeds.SUSPICIOUS,
+                             {connection.vendor: re.compile('.')}):
+            with self.assertRaises(CommandError):
+                call_command('explain_feeds', stdout=StringIO())
+
+
+class RebuildCountersCommandTests(TestCase):
+    def test_drift_is_detected_and_fixed(self):
+        """Команда находит расхождение счётчиков и исправляет его."""
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create([Post(author=author, text='Текст')])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', check=True, stdout=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        author.profile.refresh_from_db()
+        self.assertEqual(author.profile.posts_count, 1)
+        call_command('rebuild_counters', check=True, stdout=StringIO())
+
+
+class RenderBodiesCommandTests(TestCase):
+    def test_stale_bodies_are_rerendered(self):
+        """Тела, созданные в обход сигналов или старым рендерером,
+        пересобираются командой."""
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create([Post(author=author, text='Текст')])
+        post = Post.objects.get()
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=author, text='Ответ')]
+        )
+        call_command('render_bodies', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, '<p>Текст</p>')
+        self.assertEqual(post.text_html_version, rendering.RENDERER_VERSION)
+        self.assertEqual(Comment.objects.get().text_html, '<p>Ответ</p>')
+
+
+class RecommendFollowsCommandTests(TestCase):
+    def test_batch_matches_incremental(self):
+        """Пакетный пересчёт даёт те же рекомендации, что и пересчёт
+        при подписке, в том числе для подписок через bulk_create."""
+        users = [
+            User.objects.create_user(username=f'user{i}') for i in range(6)
+        ]
+        for user, author in ((0, 1), (1, 2), (1, 3), (4, 1), (4, 5)):
+            Follow.objects.create(user=users[user], author=users[author])
+            recommendations.follow_changed_now(users[user].pk)
+        incremental = set(Recommendation.objects.values_list(
+            'user_id', 'author_id'
+        ))
+        Follow.objects.bulk_create([Follow(user=users[5], author=users[0])])
+        call_command('recommend_follows', stdout=StringIO(),
+                     stderr=StringIO())
+        batch = set(Recommendation.objects.values_list(
+            'user_id', 'author_id'
+        ))
+        self.assertTrue(incremental < batch)
+        self.assertIn((users[5].pk, users[1].pk), batch)
+
+
+class TransferCommandsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Текст {i}'
+            )
+            for i in range(3)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, model, fmt):
+        path = os.path.join(self.directory, f'{model}.{fmt}')
+        call_command('export_data', model, output=path, format=fmt,
+                     stderr=StringIO())
+        return path
+
+    def round_trip(self, fmt):
+        paths = [
+            (model, self.export(model, fmt))
+            for model in ('group', 'post', 'comment', 'follow')
+        ]
+        pub_dates = list(Post.objects.values_list('pub_date', flat=True))
+        Follow.objects.all().delete()
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        for model, path in paths:
+            call_command('import_data', model, path, batch_size=2,
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            list(Post.objects.values_list('pub_date', flat=True)), pub_dates
+        )
+        post = Post.objects.get(pk=self.posts[0].pk)
+        self.assertEqual(post.group.slug, 'test-slug')
+        self.assertEqual(post.comments.get().author, self.reader)
+        self.assertEqual(post.comments_count, 1)
+        self.assertTrue(
+            Follow.objects.filter(user=self.reader, author=self.author)
+            .exists()
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 3
+        )
+        self.author.profile.refresh_from_db()
+        self.assertEqual(self.author.profile.posts_count, 3)
+
+    def test_ndjson_round_trip(self):
+        """Выгрузка NDJSON загружается обратно со ссылками и датами."""
+        self.round_trip('ndjson')
+
+    def test_csv_round_trip(self):
+        """То же для CSV."""
+        self.round_trip('csv')
+
+    def test_unknown_users(self):
+        """Строки с неизвестными пользователями пропускаются или,
+        с --create-users, создают пользователя."""
+        path = os.path.join(self.directory, 'follow.ndjson')
+        with open(path, 'w', encoding='utf-8') as dump:
+            dump.write('{"user": "new", "author": "author"}\n')
+        out = StringIO()
+        call_command('import_data', 'follow', path, stdout=out,
+                     stderr=StringIO())
+        self.assertIn('пропущено: 1', out.getvalue())
+        self.assertFalse(User.objects.filter(username='new').exists())
+        call_command('import_data', 'follow', path, create_users=True,
+                     stdout=StringIO(), stderr=StringIO())
+        new = User.objects.get(username='new')
+        self.assertFalse(new.has_usable_password())
+        self.assertTrue(Follow.objects.filter(user=new).exists())
+
+    def test_malformed_and_existing_rows_are_skipped(self):
+        """Испорченные строки пропускаются без остановки загрузки,
+        уже загруженные не входят в число загруженных."""
+        post = self.posts[1].pk
+        path = os.path.join(self.directory, 'comment.ndjson')
+        with open(path, 'w', encoding='utf-8') as dump:
+            dump.write('\n'.join([
+                '{"post": "x", "author": "reader", "text": "Нет записи"}',
+                '{"author": "reader", "text": "Без записи"}',
+                'не JSON',
+                '[1, 2]',
+                f'{{"post": {post}, "author": "reader", "text": "Дата",'
+                ' "created": "вчера"}',
+                f'{{"id": 900, "post": {post}, "author": "reader",'
+                ' "text": "Новый", "created": "2020-01-02T03:04:05+00:00"}',
+            ]) + '\n')
+        out = StringIO()
+        call_command('import_data', 'comment', path, stdout=out,
+                     stderr=StringIO())
+        self.assertIn('(comment): 1, пропущено: 5', out.getvalue())
+        comment = Comment.objects.get(pk=900)
+        self.assertEqual(comment.created.year, 2020)
+        self.assertTrue(
+            Comment._meta.get_field('created').auto_now_add
+        )
+        out = StringIO()
+        call_command('import_data', 'comment', path, stdout=out,
+                     stderr=StringIO())
+        self.assertIn('(comment): 0, пропущено: 6', out.getvalue())
+
+    def test_follow_import_resets_follow_caches(self):
+        """Загрузка подписок сбрасывает кэш подписок читателя
+        и список авторов, чьи записи читаются при запросе ленты."""
+        other = User.objects.create_user(username='other')
+        path = os.path.join(self.directory, 'follow.ndjson')
+        with open(path, 'w', encoding='utf-8') as dump:
+            dump.write('{"user": "reader", "author": "other"}\n')
+        self.assertFalse(follow_graph.is_following(self.reader.pk, other.pk))
+        fanout.pull_author_ids()
+        call_command('import_data', 'follow', path, stdout=StringIO(),
+                     stderr=StringIO())
+        self.assertTrue(follow_graph.is_following(self.reader.pk, other.pk))
+        self.assertIsNone(cache.get(fanout.PULL_AUTHORS_KEY))
+
+
+class DecayTrendingCommandTests(TestCase):
+    def test_rebuild_scores_imported_comments(self):
+        """Комментарии, загруженные в обход сигналов, учитываются
+        при пересчёте счетов, а старение их не теряет."""
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(author=author, text='Текст')
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=author, text='Ответ')] * 2
+        )
+        self.assertFalse(PostScore.objects.exists())
+        call_command('decay_trending', rebuild=True, stdout=StringIO())
+        self.assertAlmostEqual(PostScore.objects.get().score, 2, places=3)
+        call_command('decay_trending', stdout=StringIO())
+        self.assertEqual(PostScore.objects.get().post, post)
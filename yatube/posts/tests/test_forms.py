@@ -1,5 +1,6 @@
 import shutil
 import tempfile
+from unittest import mock
 
 from django.test import Client, TestCase, override_settings
 from django.conf import settings
@@ -58,16 +59,18 @@ class PostCreateFormTests(TestCase):
             'image': uploaded
         }
 
-        response = self.authorized_client.post(
-            reverse('posts:post_create'),
-            data=form_data,
-            follow=True
-        )
+        with mock.patch('posts.views.thumbnails.schedule') as schedule:
+            response = self.authorized_client.post(
+                reverse('posts:post_create'),
+                data=form_data,
+                follow=True
+            )
 
         self.assertRedirects(response, reverse(
             'posts:profile',
             kwargs={'username': 'auth'}
         ))
+        schedule.assert_called_once()
         self.assertEqual(Post.objects.count(), posts_count + 1)
         self.assertTrue(
             Post.objects.filter(
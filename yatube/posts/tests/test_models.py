@@ -1,6 +1,11 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-from ..models import Group, Post, User
+from .. import rendering
+from ..models import Comment, Follow, Group, Post, User
 
 
 class PostModelTest(TestCase):
@@ -21,3 +26,103 @@ class PostModelTest(TestCase):
         """Проверяем, что у моделей корректно работает __str__."""
         self.assertEqual(PostModelTest.post.text, 'Тестовая пост')
         self.assertEqual(PostModelTest.group.title, 'Тестовая группа')
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с записями, комментариями и подписками."""
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Текст'
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.author.profile.refresh_from_db()
+        self.reader.profile.refresh_from_db()
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.author.profile.posts_count, 1)
+        self.assertEqual(self.author.profile.followers_count, 1)
+        self.assertEqual(self.reader.profile.following_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+
+        post.delete()
+        Follow.objects.all().delete()
+        self.author.profile.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.author.profile.posts_count, 0)
+        self.assertEqual(self.author.profile.followers_count, 0)
+        self.assertEqual(self.group.posts_count, 0)
+
+    def test_group_change_moves_counter(self):
+        """Перенос записи в другую группу переносит счётчик."""
+        other = Group.objects.create(
+            title='Другая', slug='other', description='Описание'
+        )
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Текст'
+        )
+        post.group = other
+        post.save()
+        self.group.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(other.posts_count, 1)
+
+
+class RenderedBodyTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Первая строка\nвторая <b>строка</b>'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_body_rendered_on_save(self):
+        """Тело записи и комментария рендерится при сохранении."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.author, text='Да\n\nнет'
+        )
+        self.assertEqual(
+            self.post.text_html,
+            '<p>Первая строка<br>вторая &lt;b&gt;строка&lt;/b&gt;</p>'
+        )
+        self.assertEqual(comment.text_html, '<p>Да</p>\n\n<p>нет</p>')
+        self.client.force_login(self.author)
+        self.client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            {'text': 'Новый текст'}
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text_html, '<p>Новый текст</p>')
+
+    def test_feed_uses_stored_html(self):
+        """Лента не рендерит тела заново, пока версия рендерера
+        не изменилась."""
+        with mock.patch.object(rendering, 'render_text') as render_text:
+            response = self.client.get(reverse('posts:index'))
+        render_text.assert_not_called()
+        self.assertContains(response, self.post.text_html)
+
+    def test_stale_version_renders_on_the_fly(self):
+        """HTML старой версии рендерера не отдаётся."""
+        Post.objects.filter(pk=self.post.pk).update(
+            text_html='<p>старое</p>', text_html_version=0
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.body_html, rendering.render_text(post.text))
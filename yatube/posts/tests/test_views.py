@@ -1,14 +1,28 @@
+import json
 import shutil
 import tempfile
-import time
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from ..models import Group, Post, User
+from .. import (fanout, follow_graph, recommendations, related, search,
+                thumbnails, trending, versions, view_counts)
+from ..models import (Comment, FeedEntry, Follow, Group, Post, PostScore,
+                      Recommendation, RelatedLink, Thumbnail, User)
+from ..paginator import NEXT, PREVIOUS, KeysetPaginator, encode_cursor
+from ..views import COMMENT_NUMBER, POST_NUMBER
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -161,15 +175,45 @@ class PostsViewsTests(TestCase):
         self.assertTemplateUsed(response, 'core/404.html')
 
     def test_cache_index(self):
-        """Запись остаётся на главной странице после удаления 20 секунд"""
+        """Главная страница берётся из кэша до изменения записей."""
+        cache.clear()
         response_before = self.client.get('')
-        Post.objects.filter(pk=1).delete()
+        Post.objects.filter(pk=1).update(text='Изменено в обход сигналов')
         response = self.client.get('')
         self.assertEqual(response.content, response_before.content)
-        time.sleep(20)
+        Post.objects.get(pk=1).delete()
         response_after = self.client.get('')
         self.assertNotEqual(response.content, response_after.content)
 
+    def test_cache_pages_are_separate(self):
+        """Разные страницы ленты кэшируются под разными ключами."""
+        cache.clear()
+        Post.objects.bulk_create(
+            [Post(author=self.user, text=f'Запись {i}') for i in range(12)]
+        )
+        first = self.client.get(reverse('posts:index'))
+        second = self.client.get(
+            reverse('posts:index')
+            + f'?cursor={first.context["page_obj"].next_cursor}'
+        )
+        self.assertNotEqual(first.content, second.content)
+
+    def test_edit_invalidates_group_and_profile(self):
+        """Правка записи сбрасывает кэш группы и профиля."""
+        cache.clear()
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            self.client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Новый текст')
+
     def test_follow_page(self):
         """Запись пользователя появляется в ленте подписчиков"""
         self.authorized_client.get('/profile/auth/follow/')
@@ -219,3 +263,1005 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response.context['page_obj']), 10)
                 response = self.guest_client.get(reverse_name + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_cursor_pages_contain_required_records(self):
+        """Курсор следующей страницы ведёт на оставшиеся записи."""
+        response = self.guest_client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        self.assertIsNone(page_obj.previous_cursor)
+        first_page_ids = [post.pk for post in page_obj]
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?cursor={page_obj.next_cursor}'
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 3)
+        self.assertFalse(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+        self.assertFalse(
+            set(first_page_ids) & {post.pk for post in page_obj}
+        )
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?cursor={page_obj.previous_cursor}'
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            first_page_ids
+        )
+
+    def test_cursor_page_does_not_count(self):
+        """Страница по курсору не выполняет COUNT(*)."""
+        response = self.guest_client.get(reverse('posts:index'))
+        cursor = response.context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(
+                reverse('posts:index') + f'?cursor={cursor}'
+            )
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        )
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index') + '?cursor=broken'
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_forged_cursor_shows_first_page(self):
+        """Курсор с чужими значениями ключа не роняет ленты и API,
+        а открывает первую страницу."""
+        cursors = [
+            encode_cursor(['x', 'y']),
+            encode_cursor(['x', 'y'], PREVIOUS),
+            encode_cursor([timezone.now(), 'y']),
+            encode_cursor([1, 2, 3]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.guest_client.get(
+                    reverse('posts:index'), {'cursor': cursor}
+                )
+                self.assertEqual(len(response.context['page_obj']), 10)
+                response = self.guest_client.get(
+                    reverse('posts:api_index'), {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(response.json()['previous_cursor'])
+
+    def test_deep_cursor_page_seeks_index(self):
+        """Страница по курсору начинает чтение индекса с границы,
+        а не проходит его с начала."""
+        paginator = KeysetPaginator(Post.objects.feed(), POST_NUMBER)
+        queryset = paginator.object_list.filter(paginator._boundary_filter(
+            [timezone.now(), Post.objects.latest('pk').pk], NEXT
+        ))
+        plan = queryset[:POST_NUMBER + 1].explain()
+        self.assertRegex(plan, r'SEARCH \w+ USING INDEX \w+ \(pub_date<\?\)')
+
+
+class FollowFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed_posts(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return [post.text for post in response.context['page_obj']]
+
+    def test_post_is_fanned_out_to_followers(self):
+        """Новая запись раскладывается в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новая')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed_posts(), ['Новая'])
+
+    def test_follow_backfills_and_unfollow_trims_feed(self):
+        """Подписка дозаполняет ленту, отписка её очищает."""
+        Post.objects.create(author=self.author, text='Старая')
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}
+        ))
+        self.assertEqual(self.feed_posts(), ['Старая'])
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'author'}
+        ))
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed_posts(), [])
+
+    def test_popular_author_is_read_on_demand(self):
+        """Записи популярного автора дочитываются при открытии ленты."""
+        with mock.patch.object(fanout, 'FANOUT_FOLLOWERS_LIMIT', 1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            Post.objects.create(author=self.author, text='Популярная')
+            self.assertFalse(
+                FeedEntry.objects.filter(user=self.reader).exists()
+            )
+            self.assertEqual(self.feed_posts(), ['Популярная'])
+
+    def test_pull_watermark_is_kept_per_author(self):
+        """Подписка на другого популярного автора не теряет записи,
+        которые ещё не дочитаны из ленты первого."""
+        other = User.objects.create_user(username='other')
+        with mock.patch.object(fanout, 'FANOUT_FOLLOWERS_LIMIT', 1):
+            Post.objects.create(author=self.author, text='A1')
+            Follow.objects.create(user=self.reader, author=self.author)
+            self.assertEqual(self.feed_posts(), ['A1'])
+            Post.objects.create(author=self.author, text='A2')
+            Post.objects.create(author=other, text='C1')
+            Follow.objects.create(user=self.reader, author=other)
+            self.assertEqual(self.feed_posts(), ['C1', 'A2', 'A1'])
+
+    def test_pull_reads_past_backfill_limit(self):
+        """Дочитывание не обрезает записи сверх FEED_BACKFILL."""
+        with mock.patch.object(fanout, 'FANOUT_FOLLOWERS_LIMIT', 1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            Post.objects.create(author=self.author, text='Первая')
+            self.feed_posts()
+            with mock.patch.object(fanout, 'FEED_BACKFILL', 2):
+                for i in range(5):
+                    Post.objects.create(author=self.author, text=f'{i}')
+                self.feed_posts()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 6
+        )
+
+    def test_pull_without_new_posts_does_not_write(self):
+        """Открытие ленты, когда у популярного автора нет новых
+        записей, ничего не пишет в базу."""
+        with mock.patch.object(fanout, 'FANOUT_FOLLOWERS_LIMIT', 1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            Post.objects.create(author=self.author, text='Первая')
+            self.assertEqual(self.feed_posts(), ['Первая'])
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.feed_posts(), ['Первая'])
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+
+    def test_follow_graph_is_cached_and_kept_current(self):
+        """Кнопка подписки на профиле берётся из кэша подписок,
+        подписка и отписка его обновляют."""
+        authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(5)
+        ]
+        for author in authors:
+            Follow.objects.create(user=self.reader, author=author)
+        self.assertEqual(
+            list(follow_graph.following_ids(self.reader.pk)),
+            sorted(author.pk for author in authors)
+        )
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                follow_graph.is_following(self.reader.pk, authors[2].pk)
+            )
+            self.assertFalse(
+                follow_graph.is_following(self.reader.pk, self.author.pk)
+            )
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertFalse(self.reader_client.get(url).context['following'])
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'author'}
+        ))
+        self.assertTrue(self.reader_client.get(url).context['following'])
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'author'}
+        ))
+        self.assertFalse(self.reader_client.get(url).context['following'])
+        self.assertEqual(follow_graph.follower_count(authors[0].pk), 1)
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.quiet, cls.busy = [
+            Post.objects.create(author=cls.author, text=text)
+            for text in ('Тихая', 'Обсуждаемая')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, post, count=1):
+        for _ in range(count):
+            Comment.objects.create(post=post, author=self.author, text='Да')
+
+    def trending_posts(self):
+        response = self.client.get(reverse('posts:trending'))
+        return [post.text for post in response.context['page_obj']]
+
+    def test_comments_rank_posts(self):
+        """Лента «Популярное» упорядочена по счёту, который копят
+        комментарии; записи без активности в неё не попадают."""
+        Post.objects.create(author=self.author, text='Без комментариев')
+        self.comment(self.quiet)
+        self.comment(self.busy, 3)
+        self.assertEqual(self.trending_posts(), ['Обсуждаемая', 'Тихая'])
+        self.assertAlmostEqual(
+            PostScore.objects.get(post=self.busy).score,
+            3 * trending.COMMENT_WEIGHT
+        )
+        Comment.objects.filter(post=self.busy).delete()
+        self.assertEqual(self.trending_posts()[0], 'Тихая')
+
+    def test_decay_ages_and_drops_scores(self):
+        """Старение делит счёт пополам за HALF_LIFE и удаляет угасшие."""
+        self.comment(self.busy, 2)
+        score = PostScore.objects.get(post=self.busy)
+        decayed, removed = trending.decay(
+            score.decayed + trending.HALF_LIFE
+        )
+        self.assertEqual((decayed, removed), (1, 0))
+        score.refresh_from_db()
+        self.assertAlmostEqual(score.score, trending.COMMENT_WEIGHT)
+        trending.decay(score.decayed + trending.HALF_LIFE * 20)
+        self.assertEqual(self.trending_posts(), [])
+
+    def test_cursor_pages_follow_score(self):
+        """Страницы ленты идут по курсору в порядке счёта."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'Текст {i}')
+            for i in range(POST_NUMBER + 2)
+        ]
+        PostScore.objects.bulk_create([
+            PostScore(post=post, score=index + 1, decayed=timezone.now())
+            for index, post in enumerate(posts)
+        ])
+        response = self.client.get(reverse('posts:trending'))
+        page = response.context['page_obj']
+        self.assertEqual(page[0].pk, posts[-1].pk)
+        response = self.client.get(
+            reverse('posts:trending') + f'?cursor={page.next_cursor}'
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [posts[1].pk, posts[0].pk]
+        )
+        self.assertContains(response, 'Популярное')
+
+
+class ViewCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.first, cls.second = [
+            Post.objects.create(author=cls.author, text=text)
+            for text in ('Первая', 'Вторая')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        # Просмотры, накопленные другими тестами, сюда не попадают.
+        patcher = mock.patch.object(
+            view_counts, '_buffer', view_counts.Buffer()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self, post):
+        self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+
+    def views(self, post):
+        return Post.objects.values_list(
+            'views_count', flat=True
+        ).get(pk=post.pk)
+
+    def counter(self, post, count):
+        return f'<span data-post-views="{post.pk}">{count}</span>'
+
+    def test_views_are_flushed_in_one_update(self):
+        """Просмотры копятся в буфере и записываются одним UPDATE,
+        карточки показывают их без лишних запросов."""
+        self.view(self.first)
+        self.view(self.first)
+        self.view(self.second)
+        self.assertEqual(self.views(self.first), 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(view_counts.flush(), 2)
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "posts_post"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.views(self.first), 2)
+        self.assertEqual(self.views(self.second), 1)
+        self.assertTrue(
+            PostScore.objects.filter(post=self.first).exists()
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, self.counter(self.first, 2))
+
+    def test_cached_pages_show_flushed_views(self):
+        """Страницы лент берутся из кэша, а счётчики на них свежие:
+        сброс просмотров не меняет версий и ETag лент."""
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+        ]
+        etags = [self.client.get(page)['ETag'] for page in pages]
+        version = versions.get_version(versions.INDEX)
+        self.view(self.first)
+        view_counts.flush()
+        self.assertEqual(versions.get_version(versions.INDEX), version)
+        for page, etag in zip(pages, etags):
+            response = self.client.get(page)
+            self.assertEqual(response['ETag'], etag)
+            self.assertContains(response, self.counter(self.first, 1))
+            self.assertContains(response, self.counter(self.second, 0))
+
+    def test_event_limit_triggers_flush(self):
+        """Набрав FLUSH_EVENTS просмотров, буфер сбрасывается сам."""
+        with mock.patch.object(view_counts, 'FLUSH_EVENTS', 2):
+            self.view(self.first)
+            self.assertEqual(self.views(self.first), 0)
+            self.view(self.second)
+        self.assertEqual(self.views(self.first), 1)
+        self.assertEqual(self.views(self.second), 1)
+
+
+class FeedQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Имя', last_name='Фамилия'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            [Post(author=cls.user, group=cls.group, text=f'Текст {i}')
+             for i in range(POST_NUMBER)]
+        )
+        Follow.objects.create(
+            user=User.objects.create_user(username='reader'),
+            author=cls.user
+        )
+        fanout.backfill([User.objects.get(username='reader').pk],
+                        cls.user.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(User.objects.get(username='reader'))
+
+    def test_feed_pages_use_fixed_number_of_queries(self):
+        """Число запросов ленты не зависит от числа карточек."""
+        # При пустом кэше страница один раз читает время последнего
+        # изменения из базы (conditional.last_modified).
+        pages = {
+            reverse('posts:index'): 3,
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}): 4,
+            reverse('posts:profile', kwargs={'username': 'auth'}): 4,
+        }
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+
+    def test_follow_page_uses_fixed_number_of_queries(self):
+        """Лента подписок читается без запроса на каждую карточку,
+        рекомендации — одним запросом к готовой таблице."""
+        with self.assertNumQueries(6):
+            self.reader_client.get(reverse('posts:follow_index'))
+
+
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls._media_override = override_settings(MEDIA_ROOT=cls.root)
+        cls._media_override.enable()
+        cls.user = User.objects.create_user(username='auth')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Текст',
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=small_gif, content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._media_override.disable()
+        super().tearDownClass()
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def test_renditions_are_generated(self):
+        """Для картинки записи нарезаются все объявленные размеры."""
+        thumbnails.generate(self.post.pk)
+        for name, (width, height) in thumbnails.RENDITIONS.items():
+            with self.subTest(name=name):
+                thumbnail = Thumbnail.objects.get(post=self.post, name=name)
+                self.assertEqual(
+                    (thumbnail.width, thumbnail.height), (width, height)
+                )
+
+    def test_card_uses_precomputed_thumbnail(self):
+        """Карточка выводит готовую миниатюру с размерами."""
+        thumbnails.generate(self.post.pk)
+        cache.clear()
+        response = self.client.get(reverse('posts:index'))
+        thumbnail = Thumbnail.objects.get(post=self.post, name='card')
+        self.assertContains(response, thumbnail.image.url)
+        self.assertContains(response, 'width="960" height="339"')
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(author=cls.user, text='Кошки любят молоко')
+        Post.objects.create(author=cls.user, text='Собака гуляет с кошкой')
+        Post.objects.create(author=cls.user, text='Погода сегодня хорошая')
+
+    def found(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return {post.text for post in response.context['page_obj']}
+
+    def test_stemming_matches_word_forms(self):
+        """Разные формы слова приводятся к одной основе."""
+        self.assertEqual(search.stem('кошки'), search.stem('кошкой'))
+        self.assertEqual(search.stem('гуляет'), search.stem('гулять'))
+
+    def test_search_finds_word_forms(self):
+        """Поиск находит записи по другой форме слова."""
+        self.assertEqual(
+            self.found('кошка'),
+            {'Кошки любят молоко', 'Собака гуляет с кошкой'}
+        )
+        self.assertEqual(self.found('кошка собаки'),
+                         {'Собака гуляет с кошкой'})
+        self.assertEqual(self.found('слон'), set())
+
+    def test_inverted_index_fallback(self):
+        """Без FTS5 поиск работает по таблице SearchTerm."""
+        with mock.patch.object(search, 'fts_enabled', return_value=False):
+            search.rebuild()
+            self.assertEqual(
+                self.found('кошка'),
+                {'Кошки любят молоко', 'Собака гуляет с кошкой'}
+            )
+            Post.objects.filter(text__startswith='Кошки').delete()
+            self.assertEqual(self.found('кошка'),
+                             {'Собака гуляет с кошкой'})
+
+    def test_search_pages_keep_query(self):
+        """Ссылки на страницы результатов сохраняют запрос."""
+        Post.objects.bulk_create(
+            [Post(author=self.user, text='Погода') for _ in range(12)]
+        )
+        search.rebuild()
+        response = self.client.get(reverse('posts:search'), {'q': 'погода'})
+        self.assertEqual(len(response.context['page_obj']), POST_NUMBER)
+        query = urlencode({'q': 'погода'})
+        self.assertContains(response, f'?{query}&amp;cursor=')
+
+    def test_cursor_pages_rank_in_sql(self):
+        """Страницы результатов идут по курсору без повторов, а
+        релевантность считается соединением с индексом, а не
+        перечислением id в запросе."""
+        Post.objects.bulk_create(
+            [Post(author=self.user, text='Погода ' * (i + 1))
+             for i in range(12)]
+        )
+        for fts in (True, False):
+            with self.subTest(fts=fts), mock.patch.object(
+                search, 'fts_enabled', return_value=fts
+            ):
+                search.rebuild()
+                found = []
+                cursor = ''
+                with CaptureQueriesContext(connection) as queries:
+                    while cursor is not None:
+                        response = self.client.get(
+                            reverse('posts:search'),
+                            {'q': 'погода', 'cursor': cursor}
+                        )
+                        page = response.context['page_obj']
+                        found += [post.pk for post in page]
+                        cursor = page.next_cursor
+                self.assertEqual(len(found), 13)
+                self.assertEqual(len(set(found)), 13)
+                for query in queries.captured_queries:
+                    self.assertNotIn('CASE WHEN "posts_post"', query['sql'])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Текст'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def test_versions_are_bumped_again_after_commit(self):
+        """Версии страниц и кэш подписок сбрасываются повторно после
+        фиксации транзакции, в которой изменились данные."""
+        reader = User.objects.create_user(username='reader')
+        follow_graph.following_ids(reader.pk)
+        before = versions.get_version(versions.INDEX)
+        callbacks = len(connection.run_on_commit)
+        Post.objects.create(author=self.user, text='Новая')
+        Follow.objects.create(user=reader, author=self.user)
+        bumped = versions.get_version(versions.INDEX)
+        self.assertGreater(bumped, before)
+        follow_graph.following_ids(reader.pk)
+        with mock.patch.object(recommendations, '_executor'):
+            for _, callback in connection.run_on_commit[callbacks:]:
+                callback()
+        self.assertGreater(versions.get_version(versions.INDEX), bumped)
+        with self.assertNumQueries(1):
+            follow_graph.following_ids(reader.pk)
+
+    def test_unknown_query_parameters_share_fragment(self):
+        """Посторонние параметры запроса не плодят записи в кэше
+        фрагментов: ключ — только курсор или номер страницы."""
+        self.client.get(reverse('posts:index'), {'utm_source': 'mail'})
+        key = make_template_fragment_key(
+            'index_page', [versions.get_version(versions.INDEX), '']
+        )
+        self.assertIsNotNone(cache.get(key))
+
+    def test_etag_answers_not_modified(self):
+        """Повторный запрос с If-None-Match получает 304 без ленты:
+        читается только сам объект страницы."""
+        for url, queries in zip(self.urls, (0, 1, 1, 1)):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since_for_anonymous(self):
+        """Аноним с If-Modified-Since получает 304, пока нет изменений."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                last_modified = self.client.get(url)['Last-Modified']
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=last_modified
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_refresh_etag(self):
+        """Правка записи, комментарий и подписка меняют ETag."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        self.post.text = 'Новый текст'
+        self.post.save()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        detail, profile = self.urls[3], self.urls[2]
+        etag = self.client.get(detail)['ETag']
+        self.post.comments.create(author=self.user, text='Комментарий')
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = self.client.get(profile)['ETag']
+        Follow.objects.create(
+            user=User.objects.create_user(username='reader'),
+            author=self.user
+        )
+        response = self.client.get(profile, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """После входа на сайт ETag анонима уже не подходит."""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(3)
+        ]
+        cls.post = Post.objects.create(author=cls.users[0], text='Текст')
+        Comment.objects.bulk_create(
+            [Comment(post=cls.post, author=cls.users[i % 3],
+                     text=f'Комментарий {i}')
+             for i in range(COMMENT_NUMBER + 5)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:post_detail', args=[self.post.pk])
+
+    def test_first_page_is_bounded(self):
+        """На странице записи только первая страница комментариев,
+        авторы подтягиваются тем же запросом."""
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(self.url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENT_NUMBER)
+        self.assertEqual(comments[0].text, f'Комментарий {COMMENT_NUMBER + 4}')
+        self.assertContains(response, 'Показать ещё комментарии')
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.users[0], text='Ещё')
+             for _ in range(50)]
+        )
+        cache.clear()
+        with self.assertNumQueries(len(few)):
+            self.client.get(self.url)
+
+    def test_load_more_json(self):
+        """JSON-страница по курсору продолжает список без повторов."""
+        first = self.client.get(self.url).context['comments']
+        response = self.client.get(
+            reverse('posts:comments', args=[self.post.pk]),
+            {'cursor': first.next_cursor, 'format': 'json'}
+        )
+        data = response.json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            [f'Комментарий {i}' for i in range(4, -1, -1)]
+        )
+        self.assertIsNone(data['next_cursor'])
+
+    def test_load_more_fragment(self):
+        """HTML-фрагмент содержит только комментарии следующей страницы."""
+        first = self.client.get(self.url).context['comments']
+        response = self.client.get(
+            reverse('posts:comments', args=[self.post.pk]),
+            {'cursor': first.next_cursor}
+        )
+        self.assertContains(response, 'Комментарий 0')
+        self.assertNotContains(response, '<html')
+        self.assertNotContains(response, 'Показать ещё комментарии')
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            [Post(author=cls.user, group=cls.group, text=f'Запись {i}')
+             for i in range(POST_NUMBER + 5)]
+        )
+        cls.post = Post.objects.order_by('-pk').first()
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages(self):
+        """Страницы по курсору идут подряд без повторов и пропусков."""
+        url = reverse('posts:api_group', args=['test-slug'])
+        first = self.client.get(url).json()
+        second = self.client.get(url, {'cursor': first['next_cursor']}).json()
+        ids = [item['id'] for item in first['results'] + second['results']]
+        self.assertEqual(
+            ids, list(Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            ))
+        )
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(first['results'][0]['author'], 'auth')
+
+    def test_fields(self):
+        """?fields= оставляет только перечисленные поля,
+        неизвестное поле даёт 400."""
+        url = reverse('posts:api_post', args=[self.post.pk])
+        response = self.client.get(url, {'fields': 'id,text'})
+        self.assertEqual(
+            response.json(), {'id': self.post.pk, 'text': self.post.text}
+        )
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_stream(self):
+        """Выгрузка потоком отдаёт всю ленту одним ответом."""
+        response = self.client.get(
+            reverse('posts:api_profile', args=['auth']),
+            {'format': 'ndjson', 'fields': 'id'}
+        )
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), POST_NUMBER + 5)
+        self.assertEqual(json.loads(lines[0]), {'id': self.post.pk})
+
+    def test_etag(self):
+        """Повторный запрос с ETag получает 304, новая запись его
+        сбрасывает."""
+        url = reverse('posts:api_index')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.user, text='Новая')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed(self):
+        """Лента подписок доступна только после входа."""
+        url = reverse('posts:api_follow')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        results = self.client.get(url, {'limit': 3}).json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['id'], self.post.pk)
+
+    def test_follow_feed_etag_without_writes(self):
+        """Лента подписок отдаёт ETag и 304, новая запись в ленте его
+        сбрасывает, а сам запрос ничего не пишет в базу."""
+        url = reverse('posts:api_follow')
+        self.client.force_login(self.reader)
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([
+            query for query in queries
+            if not query['sql'].lstrip().upper().startswith('SELECT')
+            and 'SAVEPOINT' not in query['sql'].upper()
+        ])
+        Post.objects.create(author=self.user, text='Новая')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Новая')
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.friend, cls.author, cls.other = [
+            User.objects.create_user(username=name)
+            for name in ('reader', 'friend', 'author', 'other')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def suggested(self, url):
+        return [
+            author.username
+            for author in self.client.get(url).context['suggestions']
+        ]
+
+    def test_friends_of_friends_and_cofollows(self):
+        """Пересчёт после подписки: автор друга и автор похожего
+        читателя попадают в список, уже читаемые и сам пользователь —
+        нет."""
+        Follow.objects.create(user=self.friend, author=self.author)
+        Follow.objects.create(user=self.other, author=self.friend)
+        Follow.objects.create(user=self.other, author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.friend)
+        self.assertEqual(
+            recommendations.scores(
+                self.reader.pk, recommendations.Graph.load()
+            )[0][0],
+            self.author.pk
+        )
+        recommendations.follow_changed_now(self.reader.pk)
+        profile = reverse('posts:profile', kwargs={'username': 'reader'})
+        self.assertEqual(self.suggested(profile), ['author'])
+        self.assertEqual(
+            self.suggested(reverse('posts:follow_index')), ['author']
+        )
+        other = reverse('posts:profile', kwargs={'username': 'friend'})
+        self.assertEqual(self.suggested(other), [])
+
+    def test_follower_recomputed_on_author_follow(self):
+        """Когда друг подписывается на нового автора, его подписчики
+        получают этого автора в рекомендациях."""
+        Follow.objects.create(user=self.reader, author=self.friend)
+        Follow.objects.create(user=self.friend, author=self.author)
+        recommendations.follow_changed_now(self.friend.pk)
+        self.assertEqual(
+            self.suggested(reverse('posts:follow_index')), ['author']
+        )
+        Follow.objects.filter(user=self.friend).delete()
+        recommendations.follow_changed_now(self.friend.pk)
+        self.assertEqual(self.suggested(reverse('posts:follow_index')), [])
+
+    def test_follow_defers_recompute(self):
+        """Подписка не пересчитывает рекомендации в запросе: пересчёт
+        уходит в фон после фиксации транзакции."""
+        callbacks = len(connection.run_on_commit)
+        with mock.patch.object(
+            recommendations, 'follow_changed_now'
+        ) as follow_changed_now:
+            self.client.get(reverse(
+                'posts:profile_follow', kwargs={'username': 'friend'}
+            ))
+        follow_changed_now.assert_not_called()
+        with mock.patch.object(recommendations, '_executor') as executor:
+            for _, callback in connection.run_on_commit[callbacks:]:
+                callback()
+        executor.submit.assert_called_once_with(
+            recommendations._run, self.reader.pk
+        )
+
+    def test_readers_are_recomputed_in_one_pass(self):
+        """Число запросов пересчёта не растёт с числом подписчиков."""
+        Follow.objects.create(user=self.friend, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.friend)
+        Follow.objects.create(user=self.other, author=self.friend)
+        with CaptureQueriesContext(connection) as few:
+            recommendations.follow_changed_now(self.friend.pk)
+        for i in range(10):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'reader{i}'),
+                author=self.friend
+            )
+        with CaptureQueriesContext(connection) as many:
+            recommendations.follow_changed_now(self.friend.pk)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(Recommendation.objects.filter(
+            author=self.author
+        ).count(), 12)
+
+
+class RelatedPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls._related_override = override_settings(RELATED_ROOT=cls.root)
+        cls._related_override.enable()
+        cls.user = User.objects.create_user(username='auth')
+        texts = [
+            'Кошка спит на диване, кошка мурлычет',
+            'Моя кошка любит спать и мурлыкать',
+            'Собака гуляет в парке с мячом',
+            'Собака приносит мяч из парка',
+            'Рецепт борща со свёклой и капустой',
+        ]
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=text) for text in texts
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._related_override.disable()
+        super().tearDownClass()
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        call_command('rebuild_related', batch_size=2, stdout=StringIO())
+
+    def related_ids(self, post):
+        return [
+            item['id'] for item in Post.objects.get(pk=post.pk).related
+        ]
+
+    def assertLinksMatchLists(self):
+        self.assertEqual(
+            set(RelatedLink.objects.values_list('post', 'neighbour')),
+            {
+                (post.pk, item['id'])
+                for post in Post.objects.all() for item in post.related
+            }
+        )
+
+    def test_batch_neighbours(self):
+        """Соседи записи — записи с общими словами, без неё самой."""
+        self.assertEqual(self.related_ids(self.posts[0]), [self.posts[1].pk])
+        self.assertEqual(self.related_ids(self.posts[2]), [self.posts[3].pk])
+        self.assertEqual(self.related_ids(self.posts[4]), [])
+        self.assertLinksMatchLists()
+
+    def test_long_postings_are_cut_not_dropped(self):
+        """Длинные списки признаков укорачиваются, о чём сообщает
+        команда, а оценки соседей остаются точным косинусом."""
+        output = StringIO()
+        with mock.patch.object(related, 'MAX_POSTING', 1):
+            call_command('rebuild_related', stdout=output)
+        self.assertIn('с наибольшим весом', output.getvalue())
+        store = related.current_store()
+        self.assertIn(self.posts[0].pk, self.related_ids(self.posts[1]))
+        for post in Post.objects.all():
+            for item in post.related:
+                self.assertAlmostEqual(item['score'], related.cosine(
+                    store.read(post.pk), store.read(item['id'])
+                ), places=3)
+
+    def test_page_shows_related_without_queries(self):
+        """Похожие записи приходят вместе с записью, без лишних запросов."""
+        def page(post):
+            cache.clear()
+            return reverse('posts:post_detail', args=[post.pk])
+
+        with CaptureQueriesContext(connection) as alone:
+            self.client.get(page(self.posts[4]))
+        with self.assertNumQueries(len(alone)):
+            response = self.client.get(page(self.posts[0]))
+        self.assertContains(response, 'Похожие записи')
+        self.assertContains(
+            response, reverse('posts:post_detail', args=[self.posts[1].pk])
+        )
+
+    def test_incremental_create_edit_and_delete(self):
+        """Новая запись сразу получает соседей и попадает в их списки,
+        правка их меняет, удаление убирает запись из списков."""
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Кошка мурлычет и спит'}
+        )
+        new = Post.objects.latest('pk')
+        self.assertIn(self.posts[0].pk, self.related_ids(new))
+        self.assertIn(new.pk, self.related_ids(self.posts[1]))
+        self.client.post(
+            reverse('posts:post_edit', args=[new.pk]),
+            {'text': 'Собака и мяч в парке'}
+        )
+        self.assertIn(self.posts[3].pk, self.related_ids(new))
+        self.assertNotIn(self.posts[0].pk, self.related_ids(new))
+        self.assertNotIn(new.pk, self.related_ids(self.posts[1]))
+        self.assertIn(new.pk, self.related_ids(self.posts[3]))
+        self.assertLinksMatchLists()
+        pk = new.pk
+        with CaptureQueriesContext(connection) as queries:
+            new.delete()
+        self.assertNotIn(pk, self.related_ids(self.posts[3]))
+        self.assertLinksMatchLists()
+        self.assertFalse(
+            [query for query in queries if 'LIKE' in query['sql']]
+        )
+
+    def test_delete_clears_links_missing_from_own_list(self):
+        """Удаление убирает запись из всех списков, даже если в её
+        собственном списке этих соседей уже нет."""
+        Post.objects.filter(pk=self.posts[1].pk).update(related_posts='')
+        post = Post.objects.get(pk=self.posts[1].pk)
+        self.assertIn(post.pk, self.related_ids(self.posts[0]))
+        post.delete()
+        self.assertNotIn(self.posts[1].pk, self.related_ids(self.posts[0]))
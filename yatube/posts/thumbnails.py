@@ -0,0 +1,88 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from . import versions
+from .models import Post, Thumbnail
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, в которых показываются картинки записей.
+# Шаблоны берут готовые файлы и ничего не масштабируют сами.
+RENDITIONS = {
+    'card': (960, 339),
+}
+WORKERS = 2
+
+_executor = ThreadPoolExecutor(
+    max_workers=WORKERS, thread_name_prefix='thumbnails'
+)
+
+
+def render(source, size):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        fitted = ImageOps.fit(image, size, Image.LANCZOS)
+    if fitted.mode != 'RGB':
+        fitted = fitted.convert('RGB')
+    buffer = BytesIO()
+    fitted.save(buffer, 'JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def generate(post_id):
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author', 'group'
+    ).first()
+    existing = {
+        thumbnail.name: thumbnail
+        for thumbnail in Thumbnail.objects.filter(post_id=post_id)
+    }
+    if post is None or not post.image:
+        for thumbnail in existing.values():
+            thumbnail.image.delete(save=False)
+            thumbnail.delete()
+        return
+    base = os.path.splitext(os.path.basename(post.image.name))[0]
+    for name, size in RENDITIONS.items():
+        with post.image.open('rb') as source:
+            content = ContentFile(render(source, size))
+        thumbnail = existing.get(name) or Thumbnail(post=post, name=name)
+        if thumbnail.image:
+            thumbnail.image.delete(save=False)
+        thumbnail.image.save(f'{base}_{name}.jpg', content, save=False)
+        thumbnail.save()
+    # Карточки, закэшированные до появления миниатюр, показывали оригинал.
+    scopes = [
+        versions.INDEX,
+        versions.author_scope(post.author_id),
+        versions.post_scope(post.pk),
+    ]
+    if post.group_id is not None:
+        scopes.append(versions.group_scope(post.group_id))
+    versions.bump(*scopes)
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры записи %s', post_id)
+    finally:
+        connection.close()
+
+
+def schedule(post):
+    """Запускает нарезку миниатюр в фоне после фиксации транзакции."""
+    transaction.on_commit(lambda: _executor.submit(_run, post.pk))
+
+
+def shutdown():
+    """Дожидается уже запущенных нарезок; после этого новые не
+    принимаются. Для остановки процесса и тестов."""
+    _executor.shutdown(wait=True)
@@ -0,0 +1,382 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import (counters, fanout, follow_graph, recommendations, rendering,
+               search, trending, versions)
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 1000
+FORMATS = ('ndjson', 'csv')
+
+# Колонки выгрузки и поля модели, из которых они берутся. Внешние
+# ключи на пользователей и группы пишутся по username и slug, записи
+# и комментарии сохраняют свои id, чтобы на них могли сослаться.
+COLUMNS = {
+    'group': (Group, {
+        'slug': 'slug',
+        'title': 'title',
+        'description': 'description',
+    }),
+    'post': (Post, {
+        'id': 'pk',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'image': 'image',
+    }),
+    'comment': (Comment, {
+        'id': 'pk',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }),
+    'follow': (Follow, {
+        'user': 'user__username',
+        'author': 'author__username',
+    }),
+}
+USER_COLUMNS = {
+    'post': ('author',),
+    'comment': ('author',),
+    'follow': ('user', 'author'),
+}
+# Колонки, без которых строку не загрузить.
+REQUIRED_COLUMNS = {
+    'group': ('slug', 'title'),
+    'post': ('author', 'text'),
+    'comment': ('post', 'author', 'text'),
+    'follow': ('user', 'author'),
+}
+INTEGER_COLUMNS = ('id', 'post')
+DATE_COLUMNS = ('pub_date', 'created')
+
+
+def _plain(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_rows(name):
+    """Строки таблицы в виде словарей, по BATCH_SIZE из базы за раз."""
+    model, columns = COLUMNS[name]
+    rows = model.objects.order_by('pk').values_list(*columns.values())
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        yield dict(zip(columns, map(_plain, row)))
+
+
+def write_rows(rows, stream, fmt, name):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=list(COLUMNS[name][1]))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield row
+        return
+    for row in rows:
+        stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+        yield row
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Испорченную строку отбросит clean_row.
+            yield None
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _convert(column, value):
+    if value in (None, ''):
+        return None
+    if column in INTEGER_COLUMNS:
+        return int(value)
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def clean_row(name, row):
+    """Строка с числами и датами вместо текста или None, если строку
+    не загрузить: нет обязательной колонки или значение не
+    разбирается."""
+    if not isinstance(row, dict) or not all(
+        isinstance(row.get(column), (str, int)) and row[column] != ''
+        for column in REQUIRED_COLUMNS[name]
+    ):
+        return None
+    row = dict(row)
+    try:
+        for column in INTEGER_COLUMNS + DATE_COLUMNS:
+            if column in row:
+                row[column] = _convert(column, row[column])
+    except (TypeError, ValueError):
+        return None
+    return row
+
+
+def _user_ids(batch, columns, create_users):
+    names = {row[column] for row in batch for column in columns}
+    found = dict(
+        User.objects.filter(username__in=names).values_list('username', 'pk')
+    )
+    missing = names - found.keys()
+    if create_users and missing:
+        User.objects.bulk_create(
+            [User(username=name, password=make_password(None))
+             for name in missing],
+            ignore_conflicts=True
+        )
+        found.update(
+            User.objects.filter(username__in=missing).values_list(
+                'username', 'pk'
+            )
+        )
+    return found
+
+
+def _build_group(row):
+    return Group(
+        slug=row['slug'],
+        title=row['title'],
+        description=row.get('description') or '',
+    )
+
+
+def _build_post(row, users, groups):
+    if row.get('group') and row['group'] not in groups:
+        return None
+    post = Post(
+        pk=row.get('id') or None,
+        author_id=users[row['author']],
+        group_id=groups.get(row.get('group')),
+        text=row['text'],
+        pub_date=row.get('pub_date') or timezone.now(),
+        image=row.get('image') or '',
+    )
+    rendering.fill(post)
+    return post
+
+
+def _build_comment(row, users, posts):
+    if row['post'] not in posts:
+        return None
+    comment = Comment(
+        pk=row.get('id') or None,
+        post_id=row['post'],
+        author_id=users[row['author']],
+        text=row['text'],
+        created=row.get('created') or timezone.now(),
+    )
+    rendering.fill(comment)
+    return comment
+
+
+def _build_follow(row, users):
+    if row['user'] == row['author']:
+        return None
+    return Follow(user_id=users[row['user']], author_id=users[row['author']])
+
+
+def _objects(name, batch, users):
+    if name == 'group':
+        return [_build_group(row) for row in batch]
+    if name == 'follow':
+        return [_build_follow(row, users) for row in batch]
+    if name == 'post':
+        slugs = {row['group'] for row in batch if row.get('group')}
+        groups = dict(
+            Group.objects.filter(slug__in=slugs).values_list('slug', 'pk')
+        )
+        return [_build_post(row, users, groups) for row in batch]
+    posts = set(
+        Post.objects.filter(
+            pk__in={row['post'] for row in batch}
+        ).values_list('pk', flat=True)
+    )
+    return [_build_comment(row, users, posts) for row in batch]
+
+
+def _identity(name, obj):
+    if name == 'group':
+        return obj.slug
+    if name == 'follow':
+        return obj.user_id, obj.author_id
+    return obj.pk
+
+
+def _new_objects(name, objects):
+    """Объекты, которых ещё нет в базе и которые не повторяются
+    в пакете: ignore_conflicts отбросил бы их молча, и они попали бы
+    в число загруженных."""
+    model = COLUMNS[name][0]
+    if name == 'group':
+        existing = set(model.objects.filter(
+            slug__in=[obj.slug for obj in objects]
+        ).values_list('slug', flat=True))
+    elif name == 'follow':
+        existing = set(model.objects.filter(
+            user_id__in={obj.user_id for obj in objects},
+            author_id__in={obj.author_id for obj in objects},
+        ).values_list('user_id', 'author_id'))
+    else:
+        existing = set(model.objects.filter(
+            pk__in=[obj.pk for obj in objects if obj.pk is not None]
+        ).values_list('pk', flat=True))
+    new = []
+    for obj in objects:
+        identity = _identity(name, obj)
+        if identity is None:
+            new.append(obj)
+        elif identity not in existing:
+            existing.add(identity)
+            new.append(obj)
+    return new
+
+
+def _insert(model, objects):
+    """bulk_create, который сохраняет даты из выгрузки.
+
+    bulk_create заменяет значения полей auto_now_add текущим временем.
+    Вставка raw, как при loaddata, пишет значения объектов как есть и
+    не трогает общие для процесса поля модели.
+    """
+    fields = model._meta.concrete_fields
+    for objs, columns in (
+        ([obj for obj in objects if obj.pk is not None], fields),
+        ([obj for obj in objects if obj.pk is None],
+         [field for field in fields if field != model._meta.pk]),
+    ):
+        if not objs:
+            continue
+        size = max(connection.ops.bulk_batch_size(columns, objs), 1)
+        for batch in _batches(objs, size):
+            model._base_manager._insert(
+                batch, fields=columns, raw=True, ignore_conflicts=True
+            )
+
+
+def _after_batch(name, objects, authors):
+    # Сигналы при bulk_create не срабатывают: сбрасываем версии
+    # затронутых страниц и раскладываем подписки по лентам здесь.
+    if name == 'post':
+        authors.update(post.author_id for post in objects)
+        versions.bump(
+            versions.INDEX,
+            *[versions.author_scope(post.author_id) for post in objects],
+            *[versions.group_scope(post.group_id) for post in objects
+              if post.group_id is not None],
+        )
+    elif name == 'comment':
+        versions.bump(
+            *[versions.post_scope(comment.post_id) for comment in objects]
+        )
+    elif name == 'group':
+        groups = Group.objects.filter(
+            slug__in=[group.slug for group in objects]
+        ).values_list('pk', flat=True)
+        versions.bump(*[versions.group_scope(pk) for pk in groups])
+    else:
+        readers = {}
+        for follow in objects:
+            readers.setdefault(follow.author_id, []).append(follow.user_id)
+        for author_id, user_ids in readers.items():
+            fanout.backfill(user_ids, author_id)
+            versions.bump(
+                versions.follow_scope(author_id),
+                *[versions.follow_scope(user_id) for user_id in user_ids],
+            )
+        for user_id in {follow.user_id for follow in objects}:
+            follow_graph.invalidate(user_id)
+        # Число подписчиков могло перейти порог раскладки.
+        fanout.forget_pull_authors()
+
+
+def rebuild_derived(name, authors):
+    """Счётчики, поисковый индекс, ленты, рекомендации и счета
+    популярности, которые bulk_create не обновляет сигналами."""
+    counters.create_missing_profiles()
+    counters.rebuild()
+    if name == 'post':
+        search.rebuild()
+        for author_id in authors:
+            followers = Follow.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True)
+            fanout.backfill(list(followers), author_id)
+    elif name == 'comment':
+        trending.rebuild()
+    elif name == 'follow':
+        recommendations.rebuild()
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment]
+        ):
+            cursor.execute(sql)
+
+
+def import_rows(name, rows, batch_size=BATCH_SIZE, create_users=False,
+                rebuild=True, progress=None):
+    """Загружает строки пакетами; возвращает (загружено, пропущено).
+
+    Испорченные строки и строки со ссылкой на неизвестного
+    пользователя, группу или запись пропускаются, уже существующие
+    (по slug, паре подписки или id) не перезаписываются и тоже
+    считаются пропущенными.
+    """
+    model = COLUMNS[name][0]
+    done = skipped = 0
+    authors = set()
+    for batch in _batches(rows, batch_size):
+        rows_count = len(batch)
+        batch = [row for row in (clean_row(name, row) for row in batch)
+                 if row is not None]
+        skipped += rows_count - len(batch)
+        users = {}
+        if name in USER_COLUMNS:
+            users = _user_ids(batch, USER_COLUMNS[name], create_users)
+            known = [
+                row for row in batch
+                if all(row[column] in users for column in USER_COLUMNS[name])
+            ]
+            skipped += len(batch) - len(known)
+            batch = known
+        objects = [obj for obj in _objects(name, batch, users) if obj]
+        skipped += len(batch) - len(objects)
+        with transaction.atomic():
+            built = len(objects)
+            objects = _new_objects(name, objects)
+            skipped += built - len(objects)
+            _insert(model, objects)
+            _after_batch(name, objects, authors)
+        done += len(objects)
+        if progress is not None:
+            progress(done, skipped)
+    if rebuild:
+        rebuild_derived(name, authors)
+    return done, skipped
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Comment, Post, PostScore
+
+# Счёт записи — сумма весов событий (комментарии и просмотры),
+# каждый из которых вдвое теряет вес за HALF_LIFE. События прибавляют
+# вес к строке PostScore сразу, а старение применяет периодическая
+# задача decay: между её запусками свежие события весят столько же,
+# сколько чуть более старые, и ошибка не больше
+# 1 - 0.5 ** (интервал / HALF_LIFE).
+HALF_LIFE = timedelta(hours=12)
+COMMENT_WEIGHT = 1.0
+# Строки, чей счёт упал ниже, удаляются: лента держит только записи
+# с недавней активностью.
+MIN_SCORE = 0.01
+# Комментарии старше окна почти ничего не весят и при пересчёте
+# не читаются.
+WINDOW = HALF_LIFE * 10
+BATCH_SIZE = 1000
+KEYS = ('-trending', '-trending_post')
+
+
+def factor(elapsed):
+    return 0.5 ** (elapsed / HALF_LIFE)
+
+
+def record(post_id, weight):
+    """Прибавляет вес события к счёту записи; отрицательный вес
+    (удалённое событие) строку не создаёт."""
+    changed = PostScore.objects.filter(post_id=post_id).update(
+        score=Greatest(F('score') + weight, 0)
+    )
+    if changed or weight <= 0:
+        return
+    _, created = PostScore.objects.get_or_create(
+        post_id=post_id,
+        defaults={'score': weight, 'decayed': timezone.now()}
+    )
+    if not created:
+        PostScore.objects.filter(post_id=post_id).update(
+            score=F('score') + weight
+        )
+
+
+def record_many(weights):
+    """Как record для многих записей сразу: один UPDATE для записей,
+    у которых счёт уже есть, и bulk_create для остальных."""
+    existing = set(PostScore.objects.filter(
+        post_id__in=weights
+    ).values_list('post_id', flat=True))
+    if existing:
+        PostScore.objects.filter(post_id__in=existing).update(score=Case(
+            *[When(post_id=pk, then=F('score') + Value(weights[pk]))
+              for pk in existing],
+            output_field=FloatField()
+        ))
+    missing = Post.objects.filter(
+        pk__in=[pk for pk, weight in weights.items()
+                if pk not in existing and weight > 0]
+    ).values_list('pk', flat=True)
+    now = timezone.now()
+    PostScore.objects.bulk_create(
+        [PostScore(post_id=pk, score=weights[pk], decayed=now)
+         for pk in missing],
+        ignore_conflicts=True
+    )
+
+
+def comment_added(comment):
+    record(comment.post_id, COMMENT_WEIGHT)
+
+
+def comment_removed(comment):
+    # Снимаем тот вес, который комментарий успел сохранить.
+    record(
+        comment.post_id,
+        -COMMENT_WEIGHT * factor(timezone.now() - comment.created)
+    )
+
+
+def decay(now=None):
+    """Состаривает все счета к моменту now и удаляет угасшие.
+    Возвращает (состарено, удалено).
+
+    Строки с одинаковым временем прошлого старения обновляются одним
+    UPDATE с F(): события, пришедшие во время задачи, не теряются.
+    """
+    now = now or timezone.now()
+    stamps = PostScore.objects.filter(decayed__lt=now).values_list(
+        'decayed', flat=True
+    ).distinct()
+    decayed = 0
+    for stamp in list(stamps):
+        decayed += PostScore.objects.filter(decayed=stamp).update(
+            score=F('score') * factor(now - stamp), decayed=now
+        )
+    removed, _ = PostScore.objects.filter(score__lt=MIN_SCORE).delete()
+    return decayed, removed
+
+
+def rebuild(now=None, batch_size=BATCH_SIZE):
+    """Полный пересчёт счетов по комментариям окна WINDOW — после
+    загрузки данных в обход сигналов. Возвращает число записей."""
+    now = now or timezone.now()
+    scores = defaultdict(float)
+    comments = Comment.objects.filter(
+        created__gte=now - WINDOW
+    ).order_by().values_list('post_id', 'created')
+    for post_id, created in comments.iterator(chunk_size=batch_size):
+        scores[post_id] += COMMENT_WEIGHT * factor(now - created)
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        PostScore.objects.bulk_create(
+            [
+                PostScore(post_id=post_id, score=score, decayed=now)
+                for post_id, score in scores.items()
+                if score >= MIN_SCORE
+            ],
+            batch_size=batch_size
+        )
+    return PostScore.objects.count()
+
+
+def feed():
+    """Записи с недавней активностью для карточек ленты, ключ
+    сортировки — KEYS. Обе колонки ключа берутся из PostScore, чтобы
+    сортировка целиком шла по её индексу."""
+    return Post.objects.feed().filter(score__isnull=False).annotate(
+        trending=F('score__score'), trending_post=F('score__post')
+    )
@@ -0,0 +1,99 @@
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+INDEX = 'index'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def _key(scope):
+    return f'posts:version:{scope}'
+
+
+def _modified_key(scope):
+    return f'posts:modified:{scope}'
+
+
+def _initial():
+    # Версия, потерянная при вытеснении из кэша, начинается не с единицы,
+    # а с текущего времени, чтобы не совпасть со старыми фрагментами.
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = {_key(scope): scope for scope in scopes}
+    found = cache.get_many(list(keys))
+    missing = {key: _initial() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def get_version(scope):
+    return get_versions([scope])[scope]
+
+
+def after_commit(action):
+    """Сброс кэша сейчас и ещё раз после фиксации транзакции.
+
+    Конкурентный запрос может успеть прочитать базу до фиксации
+    и закэшировать старые данные под уже новой версией; повторный
+    сброс после COMMIT такую запись вытесняет. Вне транзакции
+    действие выполняется один раз.
+    """
+    action()
+    if connection.in_atomic_block:
+        transaction.on_commit(action)
+
+
+def bump(*scopes):
+    after_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    for scope in set(scopes):
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.set(_key(scope), _initial(), None)
+    now = int(time.time())
+    cache.set_many({_modified_key(scope): now for scope in scopes}, None)
+
+
+def get_modified(scopes):
+    """Время последнего изменения областей (Unix time) из кэша;
+    отсутствующих в кэше областей в ответе нет."""
+    keys = {_modified_key(scope): scope for scope in scopes}
+    found = cache.get_many(list(keys))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def remember_modified(scope, timestamp):
+    # add(), а не set(): не затираем отметку, которую успел поставить
+    # bump() после того, как мы прочитали базу.
+    cache.add(_modified_key(scope), timestamp, None)
+
+
+def attach_versions(posts):
+    posts = list(posts)
+    versions = get_versions([post_scope(post.pk) for post in posts])
+    for post in posts:
+        post.cache_version = versions[post_scope(post.pk)]
+    return posts
@@ -0,0 +1,134 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import trending, versions
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Просмотры копятся в памяти процесса и раз в FLUSH_INTERVAL секунд
+# (фоновым потоком) или после FLUSH_EVENTS просмотров (в запросе,
+# который набрал последний) записываются одним UPDATE на пакет
+# записей. Каждый воркер сбрасывает только свой буфер, а
+# views_count = views_count + n складывает сбросы разных процессов;
+# при падении теряется не больше одного интервала.
+FLUSH_INTERVAL = 10
+FLUSH_EVENTS = 500
+# Записей в одном UPDATE: у SQLite ограничено число параметров.
+BATCH_SIZE = 300
+VIEW_WEIGHT = 0.1
+
+
+class Buffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._events = 0
+
+    def add(self, post_id):
+        """Учитывает просмотр; True, если буфер пора сбросить."""
+        with self._lock:
+            self._counts[post_id] += 1
+            self._events += 1
+            return self._events >= FLUSH_EVENTS
+
+    def take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._events = 0
+        return counts
+
+    def restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+            self._events += sum(counts.values())
+
+
+_buffer = Buffer()
+
+
+def record(post_id):
+    if not _buffer.add(post_id):
+        return
+    try:
+        flush()
+    except Exception:
+        # Просмотры остались в буфере, страницу это не роняет.
+        logger.exception('Не удалось записать просмотры')
+
+
+def flush():
+    """Записывает накопленные просмотры: один UPDATE на BATCH_SIZE
+    записей. Возвращает число записей. При ошибке базы несохранённые
+    просмотры возвращаются в буфер до следующей попытки."""
+    counts = _buffer.take()
+    if not counts:
+        return 0
+    pending = list(counts.items())
+    try:
+        while pending:
+            batch = dict(pending[:BATCH_SIZE])
+            Post.objects.filter(pk__in=batch).update(views_count=Case(
+                *[When(pk=pk, then=F('views_count') + Value(count))
+                  for pk, count in batch.items()],
+                output_field=IntegerField()
+            ))
+            del pending[:BATCH_SIZE]
+            trending.record_many({
+                pk: count * VIEW_WEIGHT for pk, count in batch.items()
+            })
+    except Exception:
+        _buffer.restore(dict(pending))
+        raise
+    # Число просмотров показывают карточки и страница записи.
+    versions.bump(*[versions.post_scope(pk) for pk in counts])
+    return len(counts)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception('Не удалось записать просмотры')
+        finally:
+            connection.close()
+
+
+_flusher = None
+
+
+def _start_thread():
+    global _flusher
+    _flusher = threading.Thread(
+        target=_flush_periodically, name='view-counts', daemon=True
+    )
+    _flusher.start()
+
+
+def _after_fork():
+    # Буфер родителя сбросит сам родитель, а поток сброса
+    # в дочерний процесс не переходит.
+    global _buffer
+    _buffer = Buffer()
+    if _flusher is not None:
+        _start_thread()
+
+
+def start_flusher():
+    """Фоновый сброс по таймеру для процесса сервера: без него
+    буфер простаивающего воркера ждал бы следующего просмотра.
+    Остаток буфера сбрасывается и при штатной остановке."""
+    if _flusher is not None:
+        return
+    _start_thread()
+    atexit.register(flush)
+    os.register_at_fork(after_in_child=_after_fork)
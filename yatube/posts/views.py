@@ -1,74 +1,163 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import (counters, fanout, follow_graph, recommendations, search,
+               thumbnails, trending, versions, view_counts)
+from .conditional import Validators
 from .forms import CommentForm, PostForm
 from .models import Comment, Follow, Group, Post, User
+from .paginator import KeysetPaginator
 
 POST_NUMBER = 10
+COMMENT_NUMBER = 20
 
 
-def page_maker(request, posts):
-    paginator = Paginator(posts, POST_NUMBER)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def page_maker(request, posts, keys=('-pub_date', '-pk')):
+    paginator = KeysetPaginator(posts, POST_NUMBER, keys=keys)
+    page_obj = paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
+    versions.attach_versions(page_obj.object_list)
     return page_obj
 
 
+def comment_page(request, post_id):
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    )
+    paginator = KeysetPaginator(
+        comments, COMMENT_NUMBER, keys=('-created', '-pk')
+    )
+    return paginator.get_page(cursor=request.GET.get('cursor'))
+
+
 def index(request):
-    posts = Post.objects.all()
+    # Версию читаем до запроса ленты, чтобы фрагмент, собранный
+    # по устаревшим данным, не попал в кэш под новой версией.
+    validators = Validators(request, [versions.INDEX])
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    posts = Post.objects.feed()
     context = {
         'page_obj': page_maker(request, posts),
+        'cache_version': validators.versions[versions.INDEX],
+        'index': True,
     }
-    return render(request, 'posts/index.html', context)
+    return validators.apply(render(request, 'posts/index.html', context))
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
+    scope = versions.group_scope(group.pk)
+    validators = Validators(request, [scope])
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    posts = Post.objects.feed().filter(group=group)
     context = {
         'group': group,
         'page_obj': page_maker(request, posts),
+        'cache_version': validators.versions[scope],
     }
-    return render(request, 'posts/group_list.html', context)
+    return validators.apply(
+        render(request, 'posts/group_list.html', context)
+    )
 
 
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
+    user = get_object_or_404(
+        User.objects.select_related('profile'), username=username
+    )
+    scope = versions.author_scope(user.pk)
+    validators = Validators(request, [scope, versions.follow_scope(user.pk)])
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    posts = Post.objects.feed().filter(author=user)
     self_profile = True
     following = None
     if (request.user.is_authenticated) & (request.user != user):
         self_profile = False
-        auth = User.objects.filter(following__user=request.user)
-        if user in auth:
-            following = True
+        following = follow_graph.is_following(request.user.pk, user.pk)
     context = {
-        'posts': posts,
         'username': user,
+        'profile': counters.profile_of(user),
         'page_obj': page_maker(request, posts),
         'following': following,
-        'self_profile': self_profile
+        'self_profile': self_profile,
+        'suggestions': (
+            recommendations.for_user(user) if request.user == user else []
+        ),
+        'cache_version': validators.versions[scope],
     }
-    return render(request, 'posts/profile.html', context)
+    return validators.apply(render(request, 'posts/profile.html', context))
 
 
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post.objects.select_related('author'), pk=post_id)
-    posts_author = post.author.posts.all()
-    posts_counter = posts_author.count()
-    comments = Comment.objects.filter(post_id=post_id).order_by('-created')
+    post = get_object_or_404(
+        Post.objects.select_related('author__profile', 'group'),
+        pk=post_id
+    )
+    if request.method == 'GET':
+        view_counts.record(post.pk)
+    validators = Validators(request, [
+        versions.post_scope(post.pk), versions.author_scope(post.author_id)
+    ])
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    prefetch_related_objects([post], 'thumbnails')
+    posts_counter = counters.profile_of(post.author).posts_count
     context = {
         'post': post,
         'posts_counter': posts_counter,
         'form': form,
-        'comments': comments
+        'comments': comment_page(request, post.pk),
     }
-    return render(request, 'posts/post_detail.html', context)
+    return validators.apply(
+        render(request, 'posts/post_detail.html', context)
+    )
+
+
+def post_comments(request, post_id):
+    """Следующая страница комментариев для кнопки «Показать ещё»:
+    HTML-фрагмент или JSON при ?format=json."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    validators = Validators(request, [versions.post_scope(post.pk)])
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    comments = comment_page(request, post.pk)
+    if request.GET.get('format') == 'json':
+        response = JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next_cursor': comments.next_cursor,
+        })
+    else:
+        response = render(
+            request,
+            'posts/includes/comments.html',
+            {'post': post, 'comments': comments}
+        )
+    return validators.apply(response)
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     template = 'posts/create_post.html'
     user = request.user
@@ -80,10 +169,13 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = user
         post.save()
+        if post.image:
+            thumbnails.schedule(post)
         return redirect('posts:profile', user.username)
     return render(request, template, {'form': form, 'is_edit': False})
 
 
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -96,6 +188,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -106,6 +200,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -117,16 +212,43 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    posts = search.search(query)
+    context = {
+        'query': query,
+        'page_obj': page_maker(request, posts, keys=('-rank', '-pk')),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def trending_index(request):
+    """Записи с самой активной недавней жизнью: счёт ведётся заранее
+    (posts.trending), страница лишь читает его по индексу."""
+    context = {
+        'page_obj': page_maker(
+            request, trending.feed(), keys=trending.KEYS
+        ),
+        'trending': True,
+    }
+    return render(request, 'posts/trending.html', context)
+
+
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
+    posts = fanout.follow_feed(request.user)
     context = {
-        'page_obj': page_maker(request, posts),
+        'page_obj': page_maker(
+            request, posts, keys=('-feed_pub_date', '-feed_post_id')
+        ),
+        'suggestions': recommendations.for_user(request.user),
+        'follow': True,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     user = get_object_or_404(User, username=username)
     if (
@@ -142,6 +264,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     user = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=user).delete()
@@ -0,0 +1,30 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI support of its own, so the WSGI application is served
+through core.asgi.WsgiToAsgi; on Django 3.0+ the native handler is used.
+"""
+
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+try:
+    from django.core.asgi import get_asgi_application
+except ImportError:
+    from django.core.wsgi import get_wsgi_application
+
+    from core.asgi import WsgiToAsgi
+
+    application = WsgiToAsgi(
+        get_wsgi_application(),
+        max_workers=int(os.getenv('ASGI_THREADS', '8')),
+    )
+else:
+    application = get_asgi_application()
+
+from posts import view_counts  # noqa: E402
+
+view_counts.start_flusher()
@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,12 +63,25 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+# Вне DEBUG шаблоны компилируются один раз и берутся из памяти
+# (cached.Loader); TEMPLATE_WARMUP компилирует их все при старте
+# процесса, а не на первых запросах.
+TEMPLATE_SOURCE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+TEMPLATE_WARMUP = not DEBUG
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': (
+                TEMPLATE_SOURCE_LOADERS if DEBUG else [
+                    ('django.template.loaders.cached.Loader',
+                     TEMPLATE_SOURCE_LOADERS),
+                ]
+            ),
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -84,13 +99,46 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Соединения переиспользуются между запросами CONN_MAX_AGE секунд и
+# проверяются перед запросом (CONN_HEALTH_CHECKS). POOL ограничивает
+# число соединений одного воркера: при gthread MAX_SIZE должен быть не
+# меньше числа потоков. Для PostgreSQL: ENGINE core.db.backends.postgresql.
+DATABASE_CONNECTION = {
+    'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', '60')),
+    'CONN_HEALTH_CHECKS': True,
+    'POOL': {
+        'MAX_SIZE': int(os.getenv('DB_POOL_SIZE', '10')),
+        'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    },
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        **DATABASE_CONNECTION,
     }
 }
 
+# Реплики для чтения: DATABASE_REPLICAS=replica1.sqlite3,replica2.sqlite3.
+# Без переменной роутер не подключается и всё идёт в default.
+for number, path in enumerate(
+    filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'core.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, path.strip()),
+        'TEST': {'MIRROR': 'default'},
+        **DATABASE_CONNECTION,
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = (
+    ['core.routers.PrimaryReplicaRouter'] if REPLICA_DATABASES else []
+)
+# Сколько секунд после записи пользователь читает с основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+REPLICA_PIN_COOKIE = 'read_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -136,9 +184,40 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Матрица векторов для похожих записей (posts.related), создаётся
+# командой rebuild_related.
+RELATED_ROOT = os.path.join(BASE_DIR, 'related')
 
+# Общий кэш для всех воркеров: REDIS_URL=redis://host:6379/0.
+# Без него используется InMemoryRedis внутри процесса.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'memory://default'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
+
+# Метрики запросов (core.middleware.RequestMetricsMiddleware): доля
+# запросов, попадающих в сводку /admin/metrics/, и число запросов
+# к базе, после которого строка лога пишется с уровнем WARNING.
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '0.1'))
+METRICS_QUERY_WARNING = int(os.getenv('METRICS_QUERY_WARNING', '30'))
+# Время рендера по каждому шаблону и {% include %}: в Server-Timing
+# (tpl-N) и в сводке. Дороже обычного замера, по умолчанию выключено.
+METRICS_TEMPLATE_PROFILE = os.getenv('METRICS_TEMPLATE_PROFILE') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('METRICS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}